@@ -0,0 +1,176 @@
+import asyncio
+import logging
+from collections import Counter
+from datetime import date, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+class PayloadHits:
+    """
+    Deep-link payload bosishlarini xotirada sanaydi va har interval soniyada
+    bazaga bitta batch upsert bilan yozadi (har bosish uchun alohida so'rov yo'q).
+    """
+
+    def __init__(self, db, interval=60):
+        self.db = db
+        self.interval = interval
+        self._counts = Counter()
+        self._task = None
+
+    def record(self, payload):
+        # Faqat event loop ichidan chaqiriladi - lock kerak emas
+        self._counts[payload] += 1
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        if not self._counts:
+            return
+        counts, self._counts = self._counts, Counter()
+        if not await asyncio.to_thread(self.db.add_deeplink_hits, counts):
+            # Yozilmadi - keyingi flush'da qayta urinamiz
+            self._counts.update(counts)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+
+class MovieViews:
+    """
+    Haqiqatan yuborilgan kinolar (obuna tekshiruvidan o'tib, send_video muvaffaqiyatli bo'lgach).
+    Xotirada yig'ilib, har interval soniyada bitta batch bilan yoziladi.
+    """
+
+    def __init__(self, db, interval=10):
+        self.db = db
+        self.interval = interval
+        self._views = []  # [(user_id, movie_code), ...]
+        self._task = None
+
+    def record(self, user_id, movie_code):
+        self._views.append((user_id, movie_code))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        if not self._views:
+            return
+        views, self._views = self._views, []
+        if not await asyncio.to_thread(self.db.add_movie_views, views):
+            # Yozilmadi - keyingi flush'da qayta urinamiz
+            self._views.extend(views)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+
+class ActivityBitmaps:
+    """
+    Kunlik faollik va qo'shilish bitmaplari (bit i = users.seq).
+    Foydalanuvchilar xotirada yig'iladi va har interval soniyada bazaga OR qilinadi.
+    DAU/WAU/MAU va kogorta retention - bitmaplar ustida OR/AND + popcount.
+    """
+
+    def __init__(self, db, interval=60):
+        self.db = db
+        self.interval = interval
+        self._pending = {}  # (kind, sana) -> {user_id, ...}
+        self._task = None
+
+    def record_active(self, user_id):
+        self._pending.setdefault(('active', date.today()), set()).add(user_id)
+
+    def record_join(self, user_id):
+        self._pending.setdefault(('joined', date.today()), set()).add(user_id)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        for (kind, day), user_ids in pending.items():
+            if not await asyncio.to_thread(self.db.merge_activity_bitmap, kind, day, user_ids):
+                # Yozilmadi - keyingi flush'da qayta urinamiz
+                self._pending.setdefault((kind, day), set()).update(user_ids)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def activity_report(self, today=None):
+        """Qaytaradi: {'dau': .., 'wau': .., 'mau': ..}"""
+        await self.flush()
+        today = today or date.today()
+        active = await asyncio.to_thread(self.db.get_activity_bitmaps, 'active', today - timedelta(days=29), today)
+
+        week = month = 0
+        for day, bits in active.items():
+            month |= bits
+            if day > today - timedelta(days=7):
+                week |= bits
+        return {
+            'dau': active.get(today, 0).bit_count(),
+            'wau': week.bit_count(),
+            'mau': month.bit_count(),
+        }
+
+    async def retention_report(self, cohorts=7, offsets=(1, 7, 30), today=None):
+        """
+        Kogorta retention: har bir kogorta uchun barcha offsetlar to'liq kunlar bo'yicha hisoblanadi,
+        shuning uchun eng yangi kogorta - (kecha - eng katta offset) kuni.
+        Qaytaradi: [(sana, kogorta_hajmi, {offset: ulush yoki None}), ...]
+        """
+        await self.flush()
+        today = today or date.today()
+        # Bugun hali tugamagan - oxirgi to'liq kun kecha
+        last_day = today - timedelta(days=1)
+        newest = last_day - timedelta(days=max(offsets))
+        oldest = newest - timedelta(days=cohorts - 1)
+        joined, active = await asyncio.gather(
+            asyncio.to_thread(self.db.get_activity_bitmaps, 'joined', oldest, newest),
+            asyncio.to_thread(self.db.get_activity_bitmaps, 'active', oldest, last_day),
+        )
+
+        rows = []
+        for i in range(cohorts):
+            day = oldest + timedelta(days=i)
+            cohort = joined.get(day, 0)
+            size = cohort.bit_count()
+            cells = {}
+            for offset in offsets:
+                if not size:
+                    cells[offset] = None
+                else:
+                    target = day + timedelta(days=offset)
+                    cells[offset] = (cohort & active.get(target, 0)).bit_count() / size
+            rows.append((day, size, cells))
+        return rows
@@ -0,0 +1,72 @@
+"""
+Kino kodi so'rovining DB qismi uchun oldin/keyin latency taqqoslash.
+
+Eski yo'l: update_user_activity + get_required_channels + get_movie_by_code + increment_views
+Yangi yo'l: touch_user_and_get_movie (bitta round-trip); ko'rishlar yuborilgandan keyin
+add_movie_views bilan batch qilib yoziladi (bot.py da har 10 soniyada) - bu ham o'lchanadi.
+
+Ishlatish:
+    DATABASE_URL=postgres://... python bench_hot_path.py [so'rovlar_soni] [parallel_oqimlar]
+"""
+import sys
+import time
+import random
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from database import Database
+
+
+def old_path(db, user_id, movie_code):
+    db.update_user_activity(user_id)
+    db.get_required_channels()
+    movie = db.get_movie_by_code(movie_code)
+    if movie:
+        db.increment_views(movie_code)
+
+
+def new_path(db, user_id, movie_code):
+    db.touch_user_and_get_movie(user_id, movie_code)
+
+
+def run(db, fn, requests, workers, codes):
+    def one(i):
+        started = time.perf_counter()
+        fn(db, 10_000 + i % 1000, random.choice(codes))
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        latencies = sorted(executor.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    p50 = statistics.median(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{fn.__name__:>9}: p50={p50:.2f}ms p99={p99:.2f}ms  {requests / elapsed:.0f} req/s")
+
+
+def main():
+    load_dotenv()
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+
+    db = Database()
+    codes = [m['movie_code'] for m in db.get_all_movies(200)] or ["1"]
+
+    print(f"{requests} ta so'rov, {workers} ta parallel oqim")
+    for fn in (old_path, new_path):
+        run(db, fn, requests, workers, codes)
+
+    # Yangi yo'lda ko'rishlar alohida: 100 ta ko'rishlik batch qancha turadi
+    batch = [(10_000 + i, random.choice(codes)) for i in range(100)]
+    started = time.perf_counter()
+    for _ in range(20):
+        db.add_movie_views(batch)
+    per_batch = (time.perf_counter() - started) * 1000 / 20
+    print(f"    views: {per_batch:.2f}ms / 100 ta ko'rish (so'rovga {per_batch / 100:.3f}ms)")
+
+
+if __name__ == '__main__':
+    main()
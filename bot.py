@@ -1,12 +1,15 @@
-import os
 import logging
 import asyncio
 import re
+import io
+import signal
+from datetime import datetime
 from dotenv import load_dotenv
 from telegram import (
     Update,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
+    InputMediaVideo,
     ReplyKeyboardMarkup,
     KeyboardButton,
     ReplyKeyboardRemove
@@ -23,11 +26,19 @@ from telegram.ext import (
 from telegram.constants import ParseMode
 
 # O'zingizdagi mavjud fayllardan import qilamiz
+from config import BotConfig, load_bot_configs
 from database import Database
+from ingest import IngestQueue
+from snapshot import CacheSnapshotter
+from analytics import PayloadHits, MovieViews, ActivityBitmaps
+from recommend import SimilarMovies
+from tracing import TracingApplication, TracingRequest, StackSampler, traced
 from utils import (
     check_user_subscription,
-    format_channels_list
+    format_channels_list,
+    subscription_breakers
 )
+from breaker import CLOSED
 
 # Load environment variables
 load_dotenv()
@@ -39,21 +50,38 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Environment variables
-BOT_TOKEN = os.getenv('BOT_TOKEN')
-ADMIN_ID = int(os.getenv('ADMIN_ID'))
-
-CHANNEL_ID = int(os.getenv('CHANNEL_ID'))
-BOT_USERNAME = "@AF_kino_bot"  # O'zingizni bot usernameni shu yerga yozing
-
 # Initialize database
+# Bitta jarayondagi barcha botlar shu pool va keshlarni bo'lishadi
 db = Database()
 
+# /profile buyrug'i uchun (faqat so'ralganda ishlaydi)
+profiler = StackSampler()
+
+# Keshlar restartdan keyin iliq bo'lishi uchun (jarayon uchun bitta)
+snapshotter = CacheSnapshotter(db)
+
+# Deep-link (/start <payload>) bosishlari - xotirada yig'ilib, bazaga batch bilan yoziladi
+deeplink_hits = PayloadHits(db)
+
+# Yuborilgan kinolar (ko'rishlar va co-view) - yuborilgandan keyin, batch bilan yoziladi
+movie_views = MovieViews(db)
+
+# Kunlik faollik/qo'shilish bitmaplari (DAU/WAU/MAU va retention uchun)
+activity = ActivityBitmaps(db)
+
+# "Sizga yoqishi mumkin" tavsiyalari (fonda hisoblanadi, keshdan beriladi)
+similar_movies = SimilarMovies(db)
+
 # Conversation states
 WAITING_FOR_VIDEO = 1
 WAITING_FOR_CHANNEL_ID = 2
 WAITING_FOR_CHANNEL_USERNAME = 3
 WAITING_FOR_DELETE_CODE = 4
+WAITING_FOR_SERIES_NAME = 5
+WAITING_FOR_SERIES_PARTS = 6
+
+# send_media_group bir so'rovda ko'pi bilan 10 ta media qabul qiladi
+SERIES_BATCH_SIZE = 10
 
 # Admin tugmalari matnlari
 BTN_ADD_MOVIE = "➕ Kino qo'shish"
@@ -62,6 +90,7 @@ BTN_STATS = "📊 Statistika"
 BTN_LIST_MOVIES = "🎬 Kinolar ro'yxati"
 BTN_MANAGE_CHANNELS = "📢 Kanallar boshqaruvi"
 BTN_ADD_CHANNEL = "➕ Kanal qo'shish"
+BTN_ADD_SERIES = "📺 Serial qo'shish"
 BTN_BACK = "◀️ Orqaga"
 
 # ===== HELPER FUNCTIONS =====
@@ -71,65 +100,195 @@ def get_admin_keyboard():
     keyboard = [
         [KeyboardButton(BTN_ADD_MOVIE), KeyboardButton(BTN_DEL_MOVIE)], # O'chirish tugmasi qo'shildi
         [KeyboardButton(BTN_STATS), KeyboardButton(BTN_LIST_MOVIES)],
-        [KeyboardButton(BTN_MANAGE_CHANNELS)]
+        [KeyboardButton(BTN_ADD_SERIES), KeyboardButton(BTN_MANAGE_CHANNELS)]
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=False)
-def clean_caption(text):
+def get_config(context) -> BotConfig:
+    """Joriy botning sozlamalari (username, kanal, admin)"""
+    return context.bot_data['config']
+
+@traced("format.parse_movie_codes")
+def parse_movie_codes(text):
     """
-    Captiondagi link va usernamelarni tozalab, o'rniga BOT_USERNAME qo'yadi.
+    "12 13, 15-18" ko'rinishidagi matndan tartiblangan kodlar ro'yxatini oladi.
+    Noto'g'ri format bo'lsa None qaytaradi.
     """
-    if not text:
-        return f"{BOT_USERNAME}"
+    codes = []
+    for token in re.split(r'[\s,]+', text.strip()):
+        if not token:
+            continue
+        if token.isdigit():
+            codes.append(token)
+        elif re.fullmatch(r'\d+-\d+', token):
+            first, last = (int(x) for x in token.split('-'))
+            if first > last:
+                return None
+            codes.extend(str(c) for c in range(first, last + 1))
+        else:
+            return None
+    return codes or None
 
-    # 1. Havolalar (http, https, t.me) ni almashtirish
-    text = re.sub(r'(https?://\S+|t\.me/\S+)', BOT_USERNAME, text)
+async def send_series_batch(bot, config, chat_id, series_code, offset=0):
+    """
+    Serial qismlarini send_media_group orqali 10 tadan yuboradi.
+    Qismlar qolgan bo'lsa "Keyingi qismlar" tugmasi chiqadi.
+    Qaytaradi: serial topilgan bo'lsa True.
+    """
+    page = await asyncio.to_thread(db.get_series_page, series_code, offset, SERIES_BATCH_SIZE)
+    if not page:
+        return False
 
-    # 2. Boshqa username (@channel) larni almashtirish (bot o'zinikidan tashqari)
-    # Bu regex matn ichidagi @bilan boshlanadigan so'zlarni topadi
-    text = re.sub(r'@(?!\s)[a-zA-Z0-9_]+', BOT_USERNAME, text)
+    series, parts, total_parts = page
+    if not parts:
+        await bot.send_message(chat_id=chat_id, text="📭 Bu serialda boshqa qism yo'q.")
+        return True
 
-    return text
+    from utils import clean_caption
+    if len(parts) == 1:
+        # sendMediaGroup kamida 2 ta element talab qiladi (1 qismli serial yoki oxirgi yakka qism)
+        await bot.send_video(
+            chat_id=chat_id,
+            video=parts[0]['video_id'],
+            caption=clean_caption(parts[0].get('caption', ''), config.username),
+            parse_mode=ParseMode.HTML,
+            protect_content=True
+        )
+    else:
+        media = [
+            InputMediaVideo(
+                media=part['video_id'],
+                caption=clean_caption(part.get('caption', ''), config.username),
+                parse_mode=ParseMode.HTML
+            )
+            for part in parts
+        ]
+        await bot.send_media_group(chat_id=chat_id, media=media, protect_content=True)
+
+    next_offset = offset + len(parts)
+    if next_offset < total_parts:
+        keyboard = [[InlineKeyboardButton(
+            "▶️ Keyingi qismlar",
+            callback_data=f"series_{series_code}_{next_offset}"
+        )]]
+        await bot.send_message(
+            chat_id=chat_id,
+            text=f"📺 <b>{series['series_name']}</b>\n"
+                 f"Yuborildi: {next_offset}/{total_parts} qism",
+            parse_mode=ParseMode.HTML,
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
 
-def get_next_movie_code():
-    """Navbatdagi kino kodini aniqlash"""
-    # Eng oxirgi kodni olib, ustiga 1 qo'shamiz
-    last_code = db.get_last_code()
-    return str(last_code + 1)
+    if offset == 0:
+        asyncio.create_task(asyncio.to_thread(db.increment_series_views, series_code))
+    return True
+
+async def deliver_code(bot, config, chat_id, code, movie):
+    """
+    Kod bo'yicha kino (movie - touch_user_and_get_movie natijasi) yoki serialni yuborish.
+    Qaytaradi: kod topilgan bo'lsa True.
+    """
+    if movie:
+        try:
+            from utils import clean_caption
+            caption = clean_caption(movie.get('caption', ''), config.username)
+
+            await bot.send_video(
+                chat_id=chat_id,
+                video=movie['video_id'],
+                caption=caption,
+                parse_mode=ParseMode.HTML,
+                protect_content=True,  # <--- Boshqaga uzatish va saqlashni bloklaydi
+                reply_markup=similar_movies.keyboard(movie['movie_code'])
+            )
+            # Faqat haqiqatan yuborilgan kino ko'rish hisoblanadi
+            movie_views.record(chat_id, movie['movie_code'])
+        except Exception as e:
+            logger.error(f"Error sending video: {e}")
+        return True
+
+    # Kino topilmasa, serial kodi bo'lishi mumkin
+    try:
+        return await send_series_batch(bot, config, chat_id, code)
+    except Exception as e:
+        logger.error(f"Error sending series: {e}")
+        return True
+
+def parse_start_payload(args):
+    """
+    t.me/<bot>?start=<payload> dan (payload, kino_kodi).
+    Payload: "<kod>" yoki "<kod>_<kampaniya>" (masalan 45_insta). Kod bo'lmasa kino_kodi None.
+    """
+    if not args or not re.fullmatch(r'[A-Za-z0-9_-]{1,64}', args[0]):
+        return None, None
+    payload = args[0]
+    code = payload.split('_', 1)[0]
+    # Kod check_subs:<kod> callback_data ichiga (64 bayt chegarasi) sig'ishi kerak
+    return payload, (code if re.fullmatch(r'\d{1,20}', code) else None)
+
+def subscription_keyboard(movie_code=None):
+    """Obunani tekshirish tugmasi; deep-link kodi bo'lsa callback orqali olib o'tiladi"""
+    callback_data = f"check_subs:{movie_code}" if movie_code else "check_subs"
+    return InlineKeyboardMarkup([[InlineKeyboardButton("✅ Obunani tekshirish", callback_data=callback_data)]])
 
 # ===== USER HANDLERS =====
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Start command handler"""
+    """Start command handler (deep-link: /start <kod> - kino darhol yuboriladi)"""
     user = update.effective_user
+    config = get_config(context)
+
+    payload, movie_code = parse_start_payload(context.args)
+    if payload:
+        deeplink_hits.record(payload)
+
+    # Add user to database (faollik ham shu so'rovda yangilanadi)
+    # Kanallar ro'yxati (va deep-link kinosi) bilan parallel olinadi
+    if movie_code:
+        inserted, (required_channels, movie) = await asyncio.gather(
+            asyncio.to_thread(db.add_user, user.id),
+            asyncio.to_thread(db.touch_user_and_get_movie, user.id, movie_code)
+        )
+    else:
+        inserted, required_channels = await asyncio.gather(
+            asyncio.to_thread(db.add_user, user.id),
+            asyncio.to_thread(db.get_required_channels)
+        )
+        movie = None
 
-    # Add user to database
-    db.add_user(user.id)
-    db.update_user_activity(user.id)
+    if inserted:
+        activity.record_join(user.id)
+    activity.record_active(user.id)
 
     # Check if admin
-    if user.id == ADMIN_ID:
+    if user.id == config.admin_id:
         await update.message.reply_text(
             f"👋 Assalomu alaykum, Admin!\n\n"
             f"🎬 <b>Boshqaruv Paneli</b>\n",
             parse_mode=ParseMode.HTML,
             reply_markup=get_admin_keyboard()
         )
+        if movie_code:
+            await deliver_code(context.bot, config, user.id, movie_code, movie)
     else:
         # Check subscription
-        required_channels = db.get_required_channels()
         if required_channels:
             not_subscribed = await check_user_subscription(context.bot, user.id, required_channels)
             if not_subscribed:
                 message = format_channels_list(not_subscribed)
-                keyboard = [[InlineKeyboardButton("✅ Obunani tekshirish", callback_data="check_subs")]]
                 await update.message.reply_text(
                     message,
                     parse_mode=ParseMode.HTML,
-                    reply_markup=InlineKeyboardMarkup(keyboard),
+                    reply_markup=subscription_keyboard(movie_code),
                     disable_web_page_preview=True
                 )
                 return
 
+        # Deep-link orqali kelgan bo'lsa - kinoni shu update'ning o'zida yuboramiz
+        if movie_code:
+            if await deliver_code(context.bot, config, user.id, movie_code, movie):
+                return
+            await update.message.reply_text("❌ Bunday kodli kino topilmadi.")
+
         await update.message.reply_text(
             f"👋 Assalomu alaykum <b>{user.first_name}</b>!\n\n"
             f"🎬 Kino kodini yuboring (masalan: <code>45</code>)\n"
@@ -158,89 +317,120 @@ async def check_subs_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     await query.message.delete()
     await query.message.reply_text("✅ Obuna tasdiqlandi!")
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = update.effective_user
-    text = update.message.text.strip() if update.message.text else ""
 
-    # 1. Admin buyruqlariga reaksiya bildirmaslik (ular alohida handlerda)
-    if user.id == ADMIN_ID and text in [BTN_ADD_MOVIE, BTN_STATS, BTN_LIST_MOVIES, BTN_MANAGE_CHANNELS]:
-        return
+    # Deep-link'dan kelgan kod bo'lsa (check_subs:<kod>) - kinoni darhol yuboramiz
+    _, _, movie_code = query.data.partition(":")
+    if movie_code.isdigit():
+        movie = await asyncio.to_thread(db.get_movie_by_code, movie_code)
+        if not await deliver_code(context.bot, get_config(context), user.id, movie_code, movie):
+            await query.message.reply_text("❌ Bunday kodli kino topilmadi.")
+
+async def series_next_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Serialning keyingi qismlarini yuborish"""
+    query = update.callback_query
+    await query.answer()
 
-    # 2. Foydalanuvchi faolligini yangilash
-    await asyncio.to_thread(db.update_user_activity, user.id)
+    # callback_data: series_<kod>_<offset>
+    _, series_code, offset = query.data.split("_")
 
-    # 3. Majburiy obunani tekshirish
-    required_channels = await asyncio.to_thread(db.get_required_channels)
-    if required_channels and user.id != ADMIN_ID:
+    # Tugmani olib tashlaymiz, qayta bosilmasligi uchun
+    await query.edit_message_reply_markup(reply_markup=None)
+    try:
+        await send_series_batch(context.bot, get_config(context), query.from_user.id, series_code, int(offset))
+    except Exception as e:
+        logger.error(f"Error sending series: {e}")
+async def serve_user_request(context, user, message, movie_code):
+    """
+    handle_message va "Sizga yoqishi mumkin" tugmasi uchun umumiy yo'l:
+    faollik + majburiy kanallar + kino (bitta so'rovda), obuna tekshiruvi va kod bo'lsa kinoni yuborish.
+    Javoblar message ga yoziladi.
+    Qaytaradi: obunadan o'tgan bo'lsa True.
+    """
+    config = get_config(context)
+    required_channels, movie = await asyncio.to_thread(db.touch_user_and_get_movie, user.id, movie_code)
+    activity.record_active(user.id)
+
+    # Majburiy obunani tekshirish
+    if required_channels and user.id != config.admin_id:
         not_subscribed = await check_user_subscription(context.bot, user.id, required_channels)
         if not_subscribed:
-            message = format_channels_list(not_subscribed)
-            keyboard = [[InlineKeyboardButton("✅ Obunani tekshirish", callback_data="check_subs")]]
-            await update.message.reply_text(message, parse_mode=ParseMode.HTML, reply_markup=InlineKeyboardMarkup(keyboard))
-            return
+            text = format_channels_list(not_subscribed)
+            await message.reply_text(text, parse_mode=ParseMode.HTML, reply_markup=subscription_keyboard(movie_code))
+            return False
 
-    # 4. Agar raqam yuborilgan bo'lsa (Kino kodi)
-    if text.isdigit():
-        movie_code = text
-        movie = await asyncio.to_thread(db.get_movie_by_code, movie_code)
+    if movie_code and not await deliver_code(context.bot, config, user.id, movie_code, movie):
+        await message.reply_text("❌ Bunday kodli kino topilmadi.")
+    return True
 
-        if movie:
-            try:
-                from utils import clean_caption
-                original_caption = movie.get('caption', '')
-                caption = clean_caption(original_caption, BOT_USERNAME)
-
-                # --- O'ZGARTIRILGAN JOY: protect_content=True ---
-                await context.bot.send_video(
-                    chat_id=user.id,
-                    video=movie['video_id'],
-                    caption=caption,
-                    parse_mode=ParseMode.HTML,
-                    protect_content=True  # <--- Boshqaga uzatish va saqlashni bloklaydi
-                )
-                # ------------------------------------------------
+async def similar_movie_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """'Sizga yoqishi mumkin' tugmasi - tanlangan kinoni yuborish"""
+    query = update.callback_query
+    await query.answer()
 
-                # Ko'rishlar sonini oshirish
-                asyncio.create_task(asyncio.to_thread(db.increment_views, movie_code))
-            except Exception as e:
-                logger.error(f"Error sending video: {e}")
-        else:
-            await update.message.reply_text("❌ Bunday kodli kino topilmadi.")
+    # callback_data: similar_<kod>
+    movie_code = query.data.split("_", 1)[1]
+    await serve_user_request(context, query.from_user, query.message, movie_code)
+
+async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    config = get_config(context)
+    text = update.message.text.strip() if update.message.text else ""
+
+    # 1. Admin buyruqlariga reaksiya bildirmaslik (ular alohida handlerda)
+    if user.id == config.admin_id and text in [BTN_ADD_MOVIE, BTN_STATS, BTN_LIST_MOVIES, BTN_MANAGE_CHANNELS]:
+        return
+
+    # 2-4. Faollik, obuna tekshiruvi va (raqam bo'lsa) kinoni yuborish
+    movie_code = text if text.isdigit() else None
+    if not await serve_user_request(context, user, update.message, movie_code) or movie_code:
+        return
 
     # 5. Agar matn yuborilgan bo'lsa (Qidiruv)
+    movies = await asyncio.to_thread(db.search_movie_by_name, text)
+    if movies:
+        result_text = "🔎 <b>Qidiruv natijalari:</b>\n\n"
+        for m in movies:
+            result_text += f"🎬 {m['video_name']}\n🆔 Kod: <code>{m['movie_code']}</code>\n\n"
+
+        await update.message.reply_text(result_text, parse_mode=ParseMode.HTML)
     else:
-        movies = await asyncio.to_thread(db.search_movie_by_name, text)
-        if movies:
-            result_text = "🔎 <b>Qidiruv natijalari:</b>\n\n"
-            for m in movies:
-                result_text += f"🎬 {m['video_name']}\n🆔 Kod: <code>{m['movie_code']}</code>\n\n"
-            
-            await update.message.reply_text(result_text, parse_mode=ParseMode.HTML)
-        else:
-            await update.message.reply_text("❌ Bunday nomli kino topilmadi.")
+        await update.message.reply_text("❌ Bunday nomli kino topilmadi.")
 # ===== ADMIN HANDLERS =====
 
 async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Statistikani ko'rsatish"""
-    if update.effective_user.id != ADMIN_ID: return
+    if update.effective_user.id != get_config(context).admin_id: return
 
     total_users = db.get_users_count()
     total_movies = db.get_movies_count()
     active_today = db.get_active_users_today()
+    top_links = db.get_top_deeplinks(5)
+    report = await activity.activity_report()
 
     msg = (
         f"📊 <b>Statistika</b>\n\n"
         f"👥 Foydalanuvchilar: {total_users}\n"
         f"⚡️ Bugun faol: {active_today}\n"
+        f"📈 DAU / WAU / MAU: {report['dau']} / {report['wau']} / {report['mau']}\n"
         f"🎬 Kinolar soni: {total_movies}"
     )
+    # Faqat muammo bo'lgan (yoki bo'lib o'tgan) kanallar ko'rsatiladi
+    breakers = [b for b in subscription_breakers.values() if b.state != CLOSED or b.changes]
+    if breakers:
+        msg += "\n\n🛡 <b>Obuna tekshiruvi (circuit breaker):</b>\n"
+        msg += "\n".join(f"• <code>{b.describe()}</code>" for b in breakers)
+    if top_links:
+        msg += "\n\n🔗 <b>Top havolalar (start=):</b>\n"
+        msg += "\n".join(f"• <code>{l['payload']}</code> — {l['hits']}" for l in top_links)
     await update.message.reply_text(msg, parse_mode=ParseMode.HTML)
 
 async def admin_list_movies(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Kinolar ro'yxati"""
-    if update.effective_user.id != ADMIN_ID: return
+    if update.effective_user.id != get_config(context).admin_id: return
 
-    movies = db.get_all_movies(20)
+    # Admin hozirgina qo'shgan kinolarni ko'rishi uchun primary dan o'qiymiz
+    with db.read_your_writes():
+        movies = db.get_all_movies(20)
     if not movies:
         await update.message.reply_text("📭 Kinolar yo'q")
         return
@@ -253,9 +443,10 @@ async def admin_list_movies(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def admin_manage_channels(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Kanallar menyusi"""
-    if update.effective_user.id != ADMIN_ID: return
+    if update.effective_user.id != get_config(context).admin_id: return
 
-    channels = db.get_all_channels()
+    with db.read_your_writes():
+        channels = db.get_all_channels()
     text = "📢 <b>Kanallar ro'yxati:</b>\n\n"
     keyboard = []
 
@@ -276,11 +467,51 @@ async def admin_manage_channels(update: Update, context: ContextTypes.DEFAULT_TY
         parse_mode=ParseMode.HTML,
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
+async def admin_retention(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/retention - 7 ta kogorta (oxirgisi 31 kun oldin) uchun 1/7/30-kun retention"""
+    if update.effective_user.id != get_config(context).admin_id: return
+
+    rows = await activity.retention_report()
+    lines = []
+    for day, size, cells in rows:
+        parts = " | ".join(
+            f"D{offset}: {'—' if share is None else f'{share:.0%}'}" for offset, share in cells.items()
+        )
+        lines.append(f"<code>{day:%m-%d}</code> ({size}) {parts}")
+
+    await update.message.reply_text(
+        "📅 <b>Retention (kogorta: qo'shilgan kun)</b>\n\n" + "\n".join(lines),
+        parse_mode=ParseMode.HTML
+    )
+
+async def admin_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/profile [soniya] - event loop'ni sample qilib, flame graph uchun profil yuborish"""
+    if update.effective_user.id != get_config(context).admin_id: return
+
+    seconds = int(context.args[0]) if context.args and context.args[0].isdigit() else 10
+    seconds = max(1, min(seconds, 120))
+
+    if profiler.running:
+        await update.message.reply_text("⏳ Profiling allaqachon ishlayapti.")
+        return
+
+    await update.message.reply_text(f"🔬 Profiling boshlandi ({seconds} soniya)...")
+
+    async def run_profile():
+        collapsed, samples = await profiler.profile(seconds)
+        await update.message.reply_document(
+            document=io.BytesIO(collapsed.encode('utf-8')),
+            filename=f"profile-{datetime.now():%Y%m%d-%H%M%S}.folded",
+            caption=f"📈 {samples} ta sample. flamegraph.pl yoki speedscope.app da oching."
+        )
+
+    # Fonda ishlaydi - update'lar navbati to'xtab qolmasligi uchun
+    context.application.create_task(run_profile(), update=update)
 # ===== DELETE MOVIE CONVERSATION =====
 
 async def start_delete_movie(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """O'chirish jarayonini boshlash"""
-    if update.effective_user.id != ADMIN_ID: return ConversationHandler.END
+    if update.effective_user.id != get_config(context).admin_id: return ConversationHandler.END
 
     await update.message.reply_text(
         "🗑 <b>Kino o'chirish</b>\n\n"
@@ -297,6 +528,9 @@ async def receive_delete_code(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     # Bazadan o'chiramiz (Async chaqiramiz)
     is_deleted = await asyncio.to_thread(db.delete_movie, code)
+    if not is_deleted:
+        # Kino bo'lmasa, serial kodi bo'lishi mumkin
+        is_deleted = await asyncio.to_thread(db.delete_series, code)
 
     if is_deleted:
         await update.message.reply_text(
@@ -318,7 +552,7 @@ async def receive_delete_code(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 async def delete_channel_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    if query.from_user.id != ADMIN_ID: return
+    if query.from_user.id != get_config(context).admin_id: return
 
     data = query.data
     if data.startswith("del_ch_"):
@@ -332,7 +566,7 @@ async def delete_channel_callback(update: Update, context: ContextTypes.DEFAULT_
 # ===== ADD MOVIE CONVERSATION =====
 
 async def start_add_movie(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != ADMIN_ID: return ConversationHandler.END
+    if update.effective_user.id != get_config(context).admin_id: return ConversationHandler.END
 
     await update.message.reply_text(
         "🎬 <b>Kino qo'shish</b>\n\n"
@@ -365,50 +599,79 @@ async def receive_video(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # 2. Captionni tozalash
     from utils import clean_caption
-    clean_text = clean_caption(raw_caption, BOT_USERNAME)
+    clean_text = clean_caption(raw_caption, get_config(context).username)
+
+    # 3. Navbatga qo'yish: albom elementlari bitta batch bo'lib bazaga yoziladi,
+    # kanalga fonda joylanadi, yakunda admin'ga hisobot keladi
+    message = update.message
+    group_key = message.media_group_id or f"single-{message.chat_id}-{message.message_id}"
+    is_new = context.bot_data['ingest'].add(context.bot, user.id, group_key, file_id, video_name, clean_text)
+
+    if is_new:
+        await message.reply_text(
+            "⏳ <b>Qabul qilindi!</b> Saqlanmoqda...\n\n"
+            "➡️ <b>Navbatdagi videoni yuborishingiz mumkin...</b>\n"
+            "❌ To'xtatish uchun: /cancel",
+            parse_mode=ParseMode.HTML,
+            reply_markup=ReplyKeyboardRemove() # Klaviatura yo'qoladi, admin ketma-ket tashlayveradi
+        )
+    # MUHIM: END emas, WAITING_FOR_VIDEO qaytadi
+    return WAITING_FOR_VIDEO
 
-    try:
-        # 3. Kino kodini olish
-        movie_code = await asyncio.to_thread(get_next_movie_code)
+# ===== ADD SERIES CONVERSATION =====
 
-        # 4. Bazaga saqlash
-        success = await asyncio.to_thread(db.add_movie, movie_code, file_id, video_name, clean_text)
+async def start_add_series(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != get_config(context).admin_id: return ConversationHandler.END
 
-        if success:
-             # Kanalga yuborish
-            channel_caption = f"{clean_text}\n\n🆔 Kod: {movie_code}\n🤖 {BOT_USERNAME}"
+    await update.message.reply_text(
+        "📺 <b>Serial qo'shish</b>\n\n"
+        "Serial nomini yuboring.\n\n"
+        "❌ Bekor qilish: /cancel",
+        parse_mode=ParseMode.HTML,
+        reply_markup=ReplyKeyboardRemove()
+    )
+    return WAITING_FOR_SERIES_NAME
 
-            await context.bot.send_video(
-                chat_id=CHANNEL_ID,
-                video=file_id,
-                caption=channel_caption,
-                parse_mode=ParseMode.HTML
-            )
+async def receive_series_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    context.user_data['new_series_name'] = update.message.text.strip()[:500]
+    await update.message.reply_text(
+        "Endi qismlarning kino kodlarini tartib bilan yuboring.\n"
+        "Masalan: <code>12 13 14</code> yoki <code>12-20</code>",
+        parse_mode=ParseMode.HTML
+    )
+    return WAITING_FOR_SERIES_PARTS
 
-            # Admin uchun javob (Menyuni chiqarmaymiz, keyingi videoni kutamiz)
-            await update.message.reply_text(
-                f"✅ <b>Kino qo'shildi!</b>\n\n"
-                f"🆔 Kod: <code>{movie_code}</code>\n"
-                f"🎬 Nom: {video_name}\n\n"
-                f"<i>Kanalga joylandi.</i>\n"
-                f"➡️ <b>Navbatdagi videoni yuborishingiz mumkin...</b>\n"
-                f"❌ To'xtatish uchun: /cancel",
-                parse_mode=ParseMode.HTML,
-                reply_markup=ReplyKeyboardRemove() # Klaviatura yo'qoladi, admin ketma-ket tashlayveradi
-            )
-            # MUHIM O'ZGARISH: END emas, WAITING_FOR_VIDEO qaytadi
-            return WAITING_FOR_VIDEO
+async def receive_series_parts(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    movie_codes = parse_movie_codes(update.message.text)
+    if not movie_codes:
+        await update.message.reply_text("❌ Kodlar noto'g'ri! Masalan: 12 13 14 yoki 12-20")
+        return WAITING_FOR_SERIES_PARTS
 
-        else:
-            await update.message.reply_text("❌ Bazaga yozishda xatolik! Qaytadan urinib ko'ring.", reply_markup=ReplyKeyboardRemove())
-            return WAITING_FOR_VIDEO
+    # Hozirgina yuklangan kinolar replicaga hali yetib kelmagan bo'lishi mumkin
+    with db.read_your_writes():
+        missing = await asyncio.to_thread(db.get_missing_movie_codes, movie_codes)
+    if missing:
+        await update.message.reply_text(f"❌ Bu kodli kinolar topilmadi: {', '.join(missing)}")
+        return WAITING_FOR_SERIES_PARTS
+
+    series_name = context.user_data.pop('new_series_name', "Nomsiz serial")
+    series_code = await asyncio.to_thread(db.add_series, series_name, movie_codes)
+
+    if series_code:
+        await update.message.reply_text(
+            f"✅ <b>Serial qo'shildi!</b>\n\n"
+            f"🆔 Kod: <code>{series_code}</code>\n"
+            f"📺 Nom: {series_name}\n"
+            f"🎞 Qismlar: {len(movie_codes)} ta",
+            parse_mode=ParseMode.HTML,
+            reply_markup=get_admin_keyboard()
+        )
+    else:
+        await update.message.reply_text("❌ Bazaga yozishda xatolik!", reply_markup=get_admin_keyboard())
+    return ConversationHandler.END
 
-    except Exception as e:
-        logger.error(f"Add movie error: {e}")
-        await update.message.reply_text(f"❌ Xatolik: {e}\nDavom etishingiz mumkin.", reply_markup=ReplyKeyboardRemove())
-        return WAITING_FOR_VIDEO
 async def start_add_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != ADMIN_ID: return ConversationHandler.END
+    if update.effective_user.id != get_config(context).admin_id: return ConversationHandler.END
 
     # Agar tugma orqali kelgan bo'lsa
     if update.callback_query:
@@ -450,7 +713,7 @@ async def receive_channel_user(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    if user.id == ADMIN_ID:
+    if user.id == get_config(context).admin_id:
         reply_markup = get_admin_keyboard()
     else:
         reply_markup = ReplyKeyboardRemove()
@@ -460,12 +723,50 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # ===== MAIN =====
 
-def main():
-    application = Application.builder().token(BOT_TOKEN).build()
+async def post_init(application: Application):
+    """Bot ishga tushganda fon vazifalarini boshlash"""
+    await application.bot_data['ingest'].start(application.bot)
+    # Snapshot fonda yuklanadi - bot uni kutmasdan ishlay boshlaydi
+    snapshotter.start()
+    deeplink_hits.start()
+    movie_views.start()
+    activity.start()
+    similar_movies.start()
+
+async def post_stop(application: Application):
+    """Update'lar to'xtagach (bot hali ishlaydi) - kutilayotgan yuklamalarni bazaga yozish"""
+    await application.bot_data['ingest'].stop(application.bot)
+
+async def post_shutdown(application: Application):
+    """To'xtashdan oldin keshlarni saqlash"""
+    await asyncio.gather(snapshotter.stop(), deeplink_hits.stop(), movie_views.stop(), activity.stop(), similar_movies.stop())
+
+def build_application(config: BotConfig, base_url=None, primary=True):
+    """
+    Bitta bot uchun Application yaratib, barcha handlerlarni ulaydi.
+    base_url - boshqa Bot API server uchun (masalan, loadtest.py dagi lokal soxta server).
+    primary - jarayondagi birinchi bot (eski, kanali yozilmagan navbat qatorlarini oladi).
+    """
+    builder = (
+        Application.builder()
+        .token(config.token)
+        .application_class(TracingApplication)
+        .request(TracingRequest(connection_pool_size=256))
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = builder.build()
+
+    # Har bir botning o'z sozlamalari va kanal navbati; db va keshlar umumiy
+    application.bot_data['config'] = config
+    application.bot_data['ingest'] = IngestQueue(db, config.channel_id, config.username, claim_unassigned=primary)
 
     # Admin Conversations
     movie_conv = ConversationHandler(
-        entry_points=[MessageHandler(filters.Regex(f"^{BTN_ADD_MOVIE}$") & filters.User(ADMIN_ID), start_add_movie)],
+        entry_points=[MessageHandler(filters.Regex(f"^{BTN_ADD_MOVIE}$") & filters.User(config.admin_id), start_add_movie)],
         states={
             WAITING_FOR_VIDEO: [MessageHandler(filters.VIDEO, receive_video)]
         },
@@ -475,7 +776,7 @@ def main():
     channel_conv = ConversationHandler(
             entry_points=[
                 # Eski matnli buyruq
-                MessageHandler(filters.Regex(f"^{BTN_ADD_CHANNEL}$") & filters.User(ADMIN_ID), start_add_channel),
+                MessageHandler(filters.Regex(f"^{BTN_ADD_CHANNEL}$") & filters.User(config.admin_id), start_add_channel),
                 # --- YANGI QO'SHILGAN QATOR: Inline tugma uchun ---
                 CallbackQueryHandler(start_add_channel, pattern="^add_new_channel$")
             ],
@@ -485,9 +786,17 @@ def main():
             },
             fallbacks=[CommandHandler("cancel", cancel)]
         )
+    series_conv = ConversationHandler(
+        entry_points=[MessageHandler(filters.Regex(f"^{BTN_ADD_SERIES}$") & filters.User(config.admin_id), start_add_series)],
+        states={
+            WAITING_FOR_SERIES_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_series_name)],
+            WAITING_FOR_SERIES_PARTS: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_series_parts)]
+        },
+        fallbacks=[CommandHandler("cancel", cancel)]
+    )
     # Delete Movie Conversation
     del_movie_conv = ConversationHandler(
-        entry_points=[MessageHandler(filters.Regex(f"^{BTN_DEL_MOVIE}$") & filters.User(ADMIN_ID), start_delete_movie)],
+        entry_points=[MessageHandler(filters.Regex(f"^{BTN_DEL_MOVIE}$") & filters.User(config.admin_id), start_delete_movie)],
         states={
             WAITING_FOR_DELETE_CODE: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_delete_code)]
         },
@@ -497,22 +806,60 @@ def main():
 
     # Handlers
     application.add_handler(CommandHandler("start", start))
-    application.add_handler(CallbackQueryHandler(check_subs_callback, pattern="^check_subs$"))
+    application.add_handler(CommandHandler("profile", admin_profile, filters=filters.User(config.admin_id)))
+    application.add_handler(CommandHandler("retention", admin_retention, filters=filters.User(config.admin_id)))
+    application.add_handler(CallbackQueryHandler(check_subs_callback, pattern=r"^check_subs(:\d+)?$"))
     application.add_handler(CallbackQueryHandler(delete_channel_callback, pattern="^del_ch_"))
+    application.add_handler(CallbackQueryHandler(series_next_callback, pattern=r"^series_\d+_\d+$"))
+    application.add_handler(CallbackQueryHandler(similar_movie_callback, pattern=r"^similar_\d+$"))
     # Buni boshqa handlerlar qatoriga qo'shing
     application.add_handler(del_movie_conv)
     # Admin Menu Handlers
     application.add_handler(movie_conv)
+    application.add_handler(series_conv)
     application.add_handler(channel_conv) # Agar ishlatmoqchi bo'lsangiz
-    application.add_handler(MessageHandler(filters.Regex(f"^{BTN_STATS}$") & filters.User(ADMIN_ID), admin_stats))
-    application.add_handler(MessageHandler(filters.Regex(f"^{BTN_LIST_MOVIES}$") & filters.User(ADMIN_ID), admin_list_movies))
-    application.add_handler(MessageHandler(filters.Regex(f"^{BTN_MANAGE_CHANNELS}$") & filters.User(ADMIN_ID), admin_manage_channels))
+    application.add_handler(MessageHandler(filters.Regex(f"^{BTN_STATS}$") & filters.User(config.admin_id), admin_stats))
+    application.add_handler(MessageHandler(filters.Regex(f"^{BTN_LIST_MOVIES}$") & filters.User(config.admin_id), admin_list_movies))
+    application.add_handler(MessageHandler(filters.Regex(f"^{BTN_MANAGE_CHANNELS}$") & filters.User(config.admin_id), admin_manage_channels))
 
     # General Message Handler (Must be last)
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
 
-    logger.info("Bot ishga tushdi...")
-    application.run_polling()
+    return application
+
+async def run_bots(configs):
+    """Bir nechta botni bitta jarayon va event loop'da ishga tushirish"""
+    applications = [build_application(config, primary=(i == 0)) for i, config in enumerate(configs)]
+
+    for application in applications:
+        await application.initialize()
+        await application.post_init(application)
+        await application.start()
+        await application.updater.start_polling()
+        logger.info(f"Bot ishga tushdi: {application.bot_data['config'].username}")
+
+    # SIGINT/SIGTERM (Heroku restart) kelguncha ishlaymiz
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    for application in applications:
+        await application.updater.stop()
+        await application.stop()
+        await application.post_stop(application)
+        await application.shutdown()
+        await application.post_shutdown(application)
+
+def main():
+    configs = load_bot_configs()
+    if len(configs) == 1:
+        application = build_application(configs[0])
+        logger.info("Bot ishga tushdi...")
+        application.run_polling()
+    else:
+        asyncio.run(run_bots(configs))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,98 @@
+import time
+import logging
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Metrikalar: holat o'tishlari (nom, eski, yangi) -> soni va ochiq breaker rad etgan chaqiruvlar
+transitions = Counter()
+rejected = Counter()
+
+
+class CircuitBreaker:
+    """
+    Oddiy circuit breaker (faqat event loop ichidan ishlatiladi - lock kerak emas).
+
+    closed    - chaqiruvlar o'tadi; oxirgi `window` ta natijada xatolar ulushi
+                `error_rate` dan oshsa (kamida `min_calls` ta bo'lsa) -> open.
+    open      - chaqiruvlar o'tkazilmaydi; `open_seconds` dan keyin -> half_open.
+    half_open - bitta sinov chaqiruvi o'tadi: muvaffaqiyatli bo'lsa -> closed, aks holda -> open.
+
+    allow() token qaytaradi va natija shu token bilan yoziladi: holat o'zgarishidan oldin
+    boshlangan (kechikkan) chaqiruvlar natijasi hisobga olinmaydi.
+    """
+
+    def __init__(self, name, window=20, min_calls=5, error_rate=0.5, open_seconds=30):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._results = deque(maxlen=window)  # True - muvaffaqiyat, False - xato
+        self._opened_at = 0.0
+        self._probe_started = None
+        # Har holat o'zgarishi (va har yangi sinov) bilan oshadi - eski tokenlar eskiradi
+        self._generation = 0
+
+    def allow(self):
+        """
+        Chaqiruv qilish mumkin bo'lsa token, aks holda None (half_open da faqat bitta sinov).
+        Natija record_success/record_failure ga shu token bilan beriladi.
+        """
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                rejected[self.name] += 1
+                return None
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            # Sinov natijasi kelmay qolsa (bekor qilingan bo'lsa) - open_seconds dan keyin yana sinaymiz
+            now = time.monotonic()
+            if self._probe_started is not None and now - self._probe_started < self.open_seconds:
+                rejected[self.name] += 1
+                return None
+            self._probe_started = now
+            # Faqat shu sinovning natijasi qaror qiladi (oldingi osilib qolgan sinovniki emas)
+            self._generation += 1
+        return self._generation
+
+    def record_success(self, token):
+        if token != self._generation or self.state == OPEN:
+            return
+        if self.state == HALF_OPEN:
+            self._set_state(CLOSED)
+            return
+        self._results.append(True)
+
+    def record_failure(self, token):
+        if token != self._generation or self.state == OPEN:
+            return
+        if self.state == HALF_OPEN:
+            self._set_state(OPEN)
+            return
+        self._results.append(False)
+        failures = self._results.count(False)
+        if len(self._results) >= self.min_calls and failures / len(self._results) >= self.error_rate:
+            self._set_state(OPEN)
+
+    def _set_state(self, state):
+        transitions[(self.name, self.state, state)] += 1
+        logger.warning(f"Circuit breaker {self.name}: {self.state} -> {state}")
+        self.state = state
+        self._generation += 1
+        self._probe_started = None
+        self._results.clear()
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+
+    @property
+    def changes(self):
+        """Shu breaker holati necha marta o'zgargan"""
+        return sum(n for (name, _, _), n in transitions.items() if name == self.name)
+
+    def describe(self):
+        """Admin statistikasi uchun bir qator"""
+        return f"{self.name}: {self.state} (o'tishlar: {self.changes}, rad etilgan: {rejected[self.name]})"
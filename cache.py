@@ -0,0 +1,82 @@
+import time
+import threading
+
+
+class TTLCache:
+    """
+    Oddiy thread-safe TTL kesh (Database metodlari to_thread ichida chaqiriladi).
+    Bir jarayondagi barcha botlar bitta Database va shu keshlarni bo'lishadi.
+    """
+
+    def __init__(self, ttl, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+    def set(self, key, value, version=None):
+        """
+        version - ma'lumot o'qilishidan OLDIN olingan cache_versions qiymati
+        (snapshot'dan tiklashda ma'lumot eskirmaganini tekshirish uchun).
+        """
+        now = time.monotonic()
+        with self._lock:
+            if len(self._data) >= self.max_size:
+                self._evict(now)
+            self._data[key] = (now + self.ttl, value, version)
+
+    def dump(self):
+        """Snapshot uchun: [(kalit, qolgan_ttl_soniya, qiymat, versiya), ...] (muddati o'tganlar tashlanadi)"""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                (key, expires - now, value, version)
+                for key, (expires, value, version) in self._data.items() if expires > now
+            ]
+
+    def load(self, entries, age=0, version=None):
+        """
+        Snapshot'dan tiklash. age - snapshot yozilganidan beri o'tgan vaqt.
+        version - hozirgi DB versiyasi: berilsa faqat shu versiyada keshlangan yozuvlar
+        to'liq TTL bilan tiklanadi, qolganlari tashlanadi. Berilmasa qolgan TTL ishlatiladi.
+        Keshda allaqachon bor (yangiroq) kalitlar ustidan yozilmaydi.
+        """
+        now = time.monotonic()
+        loaded = 0
+        with self._lock:
+            for key, remaining, value, entry_version in entries:
+                if version is not None:
+                    if entry_version != version:
+                        continue
+                    remaining = self.ttl
+                else:
+                    remaining -= age
+                if remaining <= 0 or key in self._data or len(self._data) >= self.max_size:
+                    continue
+                self._data[key] = (now + remaining, value, entry_version)
+                loaded += 1
+        return loaded
+
+    def invalidate(self, key=None):
+        """Bitta kalitni yoki (kalitsiz) butun keshni tozalash"""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def _evict(self, now):
+        expired = [k for k, (expires, _, _) in self._data.items() if expires <= now]
+        for k in expired:
+            del self._data[k]
+        # Hammasi hali yangi bo'lsa - eng eskilarining yarmini tashlaymiz
+        if len(self._data) >= self.max_size:
+            for k in sorted(self._data, key=lambda k: self._data[k][0])[:self.max_size // 2]:
+                del self._data[k]
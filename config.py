@@ -0,0 +1,54 @@
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BOT_USERNAME = "@AF_kino_bot"  # O'zingizni bot usernameni shu yerga yozing
+
+
+class BotConfig:
+    """Bitta bot sozlamalari (bir jarayonda bir nechta bot ishlashi mumkin)"""
+
+    def __init__(self, token, admin_id, channel_id, username=DEFAULT_BOT_USERNAME):
+        self.token = token
+        self.admin_id = int(admin_id)
+        self.channel_id = int(channel_id)
+        self.username = username if username.startswith('@') else f"@{username}"
+
+    def __repr__(self):
+        return f"BotConfig({self.username}, channel={self.channel_id})"
+
+
+def load_bot_configs():
+    """
+    Botlar ro'yxatini o'qish.
+
+    BOTS - JSON ro'yxat (yoki JSON faylga yo'l):
+        [{"token": "...", "username": "@AF_kino_bot", "channel_id": -100..., "admin_id": 123}, ...]
+    BOTS bo'lmasa - eski usul: BOT_TOKEN, ADMIN_ID, CHANNEL_ID (+ BOT_USERNAME) dan bitta bot.
+    """
+    raw = os.getenv('BOTS')
+    if not raw:
+        return [BotConfig(
+            token=os.getenv('BOT_TOKEN'),
+            admin_id=os.getenv('ADMIN_ID'),
+            channel_id=os.getenv('CHANNEL_ID'),
+            username=os.getenv('BOT_USERNAME', DEFAULT_BOT_USERNAME),
+        )]
+
+    if not raw.lstrip().startswith('['):
+        with open(raw, encoding='utf-8') as f:
+            raw = f.read()
+
+    configs = [
+        BotConfig(
+            token=item['token'],
+            admin_id=item['admin_id'],
+            channel_id=item['channel_id'],
+            username=item.get('username', DEFAULT_BOT_USERNAME),
+        )
+        for item in json.loads(raw)
+    ]
+    logger.info(f"{len(configs)} ta bot sozlamasi yuklandi: {configs}")
+    return configs
@@ -1,19 +1,161 @@
 import psycopg2
 from psycopg2 import pool
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 import os
+import time
 import logging
+import itertools
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
 from datetime import datetime
 
+from cache import TTLCache
+from tracing import trace_methods
+
 logger = logging.getLogger(__name__)
 
+# Faqat o'qish uchun ulanish olishda primary ishlatilsinmi (o'z yozganini o'qish uchun)
+_primary_reads = contextvars.ContextVar('primary_reads', default=False)
+
+# _replica_failover ichida: so'rovi xato bilan tugagan replica ulanishlari (return_connection yozadi)
+_failed_reads = contextvars.ContextVar('failed_reads', default=None)
+
+
+def _replica_failover(func):
+    """
+    O'qish metodi replica'da xato bilan tugasa (uzilish, "conflict with recovery" va h.k.) -
+    bir marta primary'da qayta o'qiladi. Metodlar xatoni o'zi yutib bo'sh natija qaytaradi,
+    shuning uchun xato ulanish holatidan (uzilgan yoki tranzaksiya xato holatida) aniqlanadi.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        failed = []
+        token = _failed_reads.set(failed)
+        try:
+            result = func(self, *args, **kwargs)
+            failed_replicas = [replica for replica in failed if replica is not None]
+            if not failed_replicas:
+                return result
+
+            retry_failed = []
+            _failed_reads.set(retry_failed)
+            with self.read_your_writes():
+                result = func(self, *args, **kwargs)
+            if not retry_failed:
+                # Primary'da o'tdi - demak muammo replica'da
+                for replica in failed_replicas:
+                    replica.mark_unhealthy("query failed")
+            return result
+        finally:
+            _failed_reads.reset(token)
+    return wrapper
+
+
+class ReplicaPool:
+    """
+    Bitta read-replica uchun pool va sog'liq holati.
+    Xatolik yoki katta replication lag bo'lsa replica vaqtincha chetlashtiriladi
+    va health_interval dan keyin qayta tekshiriladi.
+    """
+
+    def __init__(self, url, max_conn=20, health_interval=10, max_lag_seconds=5):
+        self.url = url
+        self.health_interval = health_interval
+        self.max_lag_seconds = max_lag_seconds
+        self.pool = psycopg2.pool.ThreadedConnectionPool(1, max_conn, url)
+        self.healthy = True
+        self._next_check = 0
+        self._lock = threading.Lock()
+
+    def mark_unhealthy(self, reason):
+        if self.healthy:
+            logger.warning(f"Replica o'chirildi ({reason}): {self._safe_url()}")
+        self.healthy = False
+        self._next_check = time.monotonic() + self.health_interval
+
+    def is_available(self):
+        """Sog'lom bo'lsa True; tekshirish vaqti kelgan bo'lsa (bitta thread) qayta tekshiradi"""
+        now = time.monotonic()
+        if now < self._next_check:
+            return self.healthy
+        if not self._lock.acquire(blocking=False):
+            return self.healthy
+        try:
+            self._check()
+        finally:
+            self._lock.release()
+        return self.healthy
+
+    def _check(self):
+        conn = None
+        try:
+            conn = self.pool.getconn()
+            cur = conn.cursor()
+            # Hamma WAL qo'llangan bo'lsa lag 0 (yozuv bo'lmasa replay_timestamp eskirib qoladi)
+            cur.execute('''
+                SELECT CASE
+                    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                END
+            ''')
+            lag = float(cur.fetchone()[0])
+            cur.close()
+            conn.rollback()
+            if lag > self.max_lag_seconds:
+                self.mark_unhealthy(f"lag {lag:.1f}s")
+                return
+            if not self.healthy:
+                logger.info(f"Replica qayta ulandi: {self._safe_url()}")
+            self.healthy = True
+            self._next_check = time.monotonic() + self.health_interval
+        except psycopg2.pool.PoolError:
+            # Pool to'lgan - replica band, lekin ishlayapti: holat o'zgarmaydi, keyinroq tekshiriladi
+            self._next_check = time.monotonic() + self.health_interval
+        except Exception as e:
+            self.mark_unhealthy(e)
+            if conn is not None:
+                self.pool.putconn(conn, close=True)
+                conn = None
+        finally:
+            if conn is not None:
+                self.pool.putconn(conn)
+
+    def _safe_url(self):
+        # Parolni logga chiqarmaslik uchun
+        return self.url.rsplit('@', 1)[-1]
+
+
+@trace_methods("db", exclude=("get_connection", "get_read_connection", "return_connection", "read_your_writes", "init_db"))
 class Database:
-    def __init__(self):
-        self.database_url = os.getenv('DATABASE_URL')
+    def __init__(self, database_url=None, replica_urls=None):
+        """
+        database_url - primary (yozish va o'qish). Berilmasa DATABASE_URL.
+        replica_urls - faqat o'qish uchun replicalar ro'yxati. Berilmasa DATABASE_REPLICA_URLS (vergul bilan).
+        """
+        self.database_url = database_url or os.getenv('DATABASE_URL')
+        if replica_urls is None:
+            replica_urls = [u.strip() for u in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if u.strip()]
+
+        # Umumiy keshlar: bir jarayondagi barcha botlar shu Database obyektini bo'lishadi
+        self.channels_cache = TTLCache(ttl=30)
+        self.search_cache = TTLCache(ttl=60)
+        self.series_cache = TTLCache(ttl=300)
+        # Kino kodi -> kino (views ustunisiz - ko'rishlar MovieViews orqali alohida sanaladi)
+        self.movie_cache = TTLCache(ttl=300, max_size=50000)
+        # O'xshash kinolar fon jobida to'liq to'ldiriladi (TTL - rebuild intervalidan uzun)
+        self.similar_cache = TTLCache(ttl=3 * 3600, max_size=100000)
+
+        # Qaysi ulanish qaysi poolga qaytishi kerak (id(conn) -> ReplicaPool)
+        self._replica_conns = {}
+        self._replica_index = itertools.count()
+        self.replicas = []
+
         # Connection Pool yaratish (Tezlik uchun eng muhim qism)
-        # Min: 1, Max: 10 ta ulanish ochib qo'yadi
+        # Min: 1, Max: 20 ta ulanish; to_thread'lardan chaqirilgani uchun Threaded pool
         try:
-            self.pool = psycopg2.pool.SimpleConnectionPool(
+            self.pool = psycopg2.pool.ThreadedConnectionPool(
                 1, 20,
                 self.database_url
             )
@@ -23,14 +165,75 @@ class Database:
         except Exception as e:
             logger.error(f"Database connection error: {e}")
 
+        for url in replica_urls:
+            try:
+                self.replicas.append(ReplicaPool(url))
+            except Exception as e:
+                logger.error(f"Replica connection error: {e}")
+        if self.replicas:
+            logger.info(f"{len(self.replicas)} ta read-replica ulandi")
+
     def get_connection(self):
-        """Pool dan ulanish olish"""
+        """Pool dan ulanish olish (primary)"""
         return self.pool.getconn()
 
+    def get_read_connection(self):
+        """
+        Faqat o'qish uchun ulanish: sog'lom replicalardan navbat bilan,
+        hammasi ishlamasa yoki read_your_writes() ichida bo'lsa - primary.
+        """
+        if self.replicas and not _primary_reads.get():
+            start = next(self._replica_index)
+            for i in range(len(self.replicas)):
+                replica = self.replicas[(start + i) % len(self.replicas)]
+                if not replica.is_available():
+                    continue
+                try:
+                    conn = replica.pool.getconn()
+                except psycopg2.pool.PoolError:
+                    # Pool to'lgan - replica sog'lom, shunchaki band: keyingisi/primary ga o'tamiz
+                    continue
+                except Exception as e:
+                    replica.mark_unhealthy(e)
+                    continue
+                if conn.closed:
+                    replica.pool.putconn(conn, close=True)
+                    replica.mark_unhealthy("connection closed")
+                    continue
+                self._replica_conns[id(conn)] = replica
+                return conn
+        return self.get_connection()
+
     def return_connection(self, conn):
-        """Ulanishni Pool ga qaytarish"""
-        if conn:
-            self.pool.putconn(conn)
+        """Ulanishni o'z Pool iga qaytarish (uzilgan ulanish yopiladi)"""
+        if not conn:
+            return
+        replica = self._replica_conns.pop(id(conn), None)
+        failed = _failed_reads.get()
+        if failed is not None and (
+            conn.closed or conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_INERROR
+        ):
+            # Primary ulanishi bo'lsa ham belgilanadi - qayta urinish natijasini bilish uchun
+            failed.append(replica)
+        if replica is None:
+            self.pool.putconn(conn, close=bool(conn.closed))
+            return
+        if conn.closed:
+            # So'rov paytida replica uzildi - keyingi o'qishlar boshqa replica/primary ga
+            replica.mark_unhealthy("connection lost")
+        replica.pool.putconn(conn, close=bool(conn.closed))
+
+    @contextmanager
+    def read_your_writes(self):
+        """
+        Shu blok ichidagi (va undan chaqirilgan to_thread) o'qishlar primary dan o'qiladi -
+        hozirgina yozilgan ma'lumotni replication lag'siz ko'rish uchun.
+        """
+        token = _primary_reads.set(True)
+        try:
+            yield
+        finally:
+            _primary_reads.reset(token)
 
     def init_db(self):
         """Jadvallarni yaratish va yangilash"""
@@ -67,6 +270,42 @@ class Database:
                 )
             ''')
 
+            # Zich tartib raqami: faollik bitmaplarida foydalanuvchining bit o'rni
+            # (Telegram user_id juda siyrak, bitmap uchun yaramaydi). Eski qatorlar ham to'ldiriladi
+            cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS seq BIGSERIAL")
+            cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS users_seq_idx ON users (seq)")
+
+            # Kunlik bitmaplar: kind = 'active' (shu kuni faol) yoki 'joined' (shu kuni qo'shilgan).
+            # bit i = users.seq = i, little-endian
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS activity_bitmaps (
+                    kind VARCHAR(10) NOT NULL,
+                    day DATE NOT NULL,
+                    bitmap BYTEA NOT NULL DEFAULT ''::bytea,
+                    PRIMARY KEY (kind, day)
+                )
+            ''')
+
+            # Kim qaysi kinoni ko'rgan (co-view tavsiyalari uchun)
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS movie_views (
+                    user_id BIGINT NOT NULL,
+                    movie_code VARCHAR(50) NOT NULL,
+                    viewed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (user_id, movie_code)
+                )
+            ''')
+            cur.execute("CREATE INDEX IF NOT EXISTS movie_views_code_idx ON movie_views (movie_code)")
+
+            # Har bir kino uchun oldindan hisoblangan top-K o'xshash kinolar (tartib bo'yicha)
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS movie_similar (
+                    movie_code VARCHAR(50) PRIMARY KEY,
+                    neighbours VARCHAR(50)[] NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
             # Channels jadvali
             cur.execute('''
                 CREATE TABLE IF NOT EXISTS channels (
@@ -78,6 +317,84 @@ class Database:
                 )
             ''')
 
+            # Seriallar jadvali (ota kod)
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS series (
+                    id SERIAL PRIMARY KEY,
+                    series_code VARCHAR(50) UNIQUE NOT NULL,
+                    series_name VARCHAR(500),
+                    views INTEGER DEFAULT 0,
+                    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            # Serial qismlari (tartib bilan, har bir qism - oddiy kino kodi)
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS series_parts (
+                    series_code VARCHAR(50) NOT NULL REFERENCES series(series_code) ON DELETE CASCADE,
+                    part_number INTEGER NOT NULL,
+                    movie_code VARCHAR(50) NOT NULL REFERENCES movies(movie_code) ON DELETE CASCADE,
+                    PRIMARY KEY (series_code, part_number)
+                )
+            ''')
+
+            # Kanalga hali joylanmagan kinolar (outbox). Post muvaffaqiyatli bo'lgach o'chiriladi,
+            # shuning uchun bot qayta ishga tushsa ham navbat yo'qolmaydi
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS pending_posts (
+                    movie_code VARCHAR(50) PRIMARY KEY REFERENCES movies(movie_code) ON DELETE CASCADE,
+                    group_key VARCHAR(100) NOT NULL,
+                    attempts INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            # Bir nechta bot bo'lsa, har bir post qaysi kanalga ketishi kerakligi
+            cur.execute("ALTER TABLE pending_posts ADD COLUMN IF NOT EXISTS channel_id BIGINT")
+
+            # Deep-link (/start <payload>) bosishlari statistikasi
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS deeplink_hits (
+                    payload VARCHAR(64) PRIMARY KEY,
+                    hits BIGINT DEFAULT 0,
+                    last_hit TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            # Kesh versiyalari: katalog yoki kanallar o'zgarganda trigger versiyani oshiradi.
+            # Cache snapshot (snapshot.py) shu versiyalar bo'yicha eskirganini aniqlaydi
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS cache_versions (
+                    name VARCHAR(50) PRIMARY KEY,
+                    version BIGINT NOT NULL DEFAULT 0
+                )
+            ''')
+            cur.execute('''
+                CREATE OR REPLACE FUNCTION bump_cache_version() RETURNS trigger AS $$
+                BEGIN
+                    INSERT INTO cache_versions (name, version) VALUES (TG_ARGV[0], 1)
+                    ON CONFLICT (name) DO UPDATE SET version = cache_versions.version + 1;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql
+            ''')
+            # views ustuni o'zgarishi (har bir so'rov) versiyani oshirmaydi
+            for table, events, version_name in (
+                ('movies', 'INSERT OR DELETE OR UPDATE OF video_id, video_name, caption, movie_code', 'catalog'),
+                ('series', 'INSERT OR DELETE OR UPDATE OF series_code, series_name', 'catalog'),
+                ('series_parts', 'INSERT OR DELETE OR UPDATE', 'catalog'),
+                ('channels', 'INSERT OR DELETE OR UPDATE', 'channels'),
+            ):
+                # Har restartda jadvalni lock qilmaslik uchun faqat yo'q bo'lsa yaratamiz
+                cur.execute(f'''
+                    DO $$ BEGIN
+                        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = '{table}_cache_version') THEN
+                            CREATE TRIGGER {table}_cache_version
+                            AFTER {events} ON {table}
+                            FOR EACH STATEMENT EXECUTE FUNCTION bump_cache_version('{version_name}');
+                        END IF;
+                    END $$
+                ''')
+
             conn.commit()
             cur.close()
         except Exception as e:
@@ -88,26 +405,97 @@ class Database:
 
     # ===== MOVIES OPERATIONS =====
 
-    def add_movie(self, movie_code, video_id, video_name, caption=None):
-        """Kino qo'shish (caption bilan)"""
+    def _lock_last_code(self, cur):
+        """
+        Kod ajratish lockini olib (tranzaksiya oxirigacha), eng katta kodni qaytaradi.
+        Kino va serial kodlari bitta ketma-ketlikda - parallel yozuvlar bir xil kod olmasin.
+        """
+        cur.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', ('movie_code_seq',))
+        cur.execute('''
+            SELECT COALESCE(MAX(code), 0) FROM (
+                SELECT CAST(movie_code AS INTEGER) AS code FROM movies
+                UNION ALL
+                SELECT CAST(series_code AS INTEGER) AS code FROM series
+            ) AS codes
+        ''')
+        return cur.fetchone()[0]
+
+    def add_movies_batch(self, items, group_key, channel_id):
+        """
+        Bir nechta kinoni bitta tranzaksiyada qo'shish va channel_id kanali navbatiga (pending_posts) yozish.
+        items: [(video_id, video_name, caption), ...]
+        Qaytaradi: berilgan kodlar ro'yxati yoki xatolikda None.
+        """
         conn = self.get_connection()
         try:
             cur = conn.cursor()
-            cur.execute(
-                '''INSERT INTO movies (movie_code, video_id, video_name, caption)
-                   VALUES (%s, %s, %s, %s)''',
-                (movie_code, video_id, video_name, caption)
+            last_code = self._lock_last_code(cur)
+
+            codes = [str(last_code + i) for i in range(1, len(items) + 1)]
+            rows = [(code,) + tuple(item) for code, item in zip(codes, items)]
+            execute_values(
+                cur,
+                'INSERT INTO movies (movie_code, video_id, video_name, caption) VALUES %s',
+                rows
+            )
+            execute_values(
+                cur,
+                'INSERT INTO pending_posts (movie_code, group_key, channel_id) VALUES %s',
+                [(code, group_key, channel_id) for code in codes]
             )
             conn.commit()
             cur.close()
-            return True
-        except psycopg2.IntegrityError:
+            self.search_cache.invalidate()
+            return codes
+        except Exception as e:
+            logger.error(f"Add movies batch error: {e}")
             conn.rollback()
-            return False
+            return None
+        finally:
+            self.return_connection(conn)
+
+    def get_pending_posts(self, channel_id, claim_unassigned=False):
+        """
+        channel_id kanaliga joylanmagan kinolar (guruh bo'yicha tartiblangan).
+        claim_unassigned - kanali yozilmagan eski qatorlarni ham olish (faqat bitta bot uchun).
+        """
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute(
+                '''SELECT p.group_key, m.movie_code, m.video_id, m.video_name, m.caption
+                   FROM pending_posts p
+                   JOIN movies m ON m.movie_code = p.movie_code
+                   WHERE p.channel_id = %s OR (%s AND p.channel_id IS NULL)
+                   ORDER BY p.created_at, CAST(m.movie_code AS INTEGER)''',
+                (channel_id, claim_unassigned)
+            )
+            posts = cur.fetchall()
+            cur.close()
+            return posts
+        except Exception as e:
+            logger.error(f"Pending posts error: {e}")
+            return []
+        finally:
+            self.return_connection(conn)
+
+    def finish_pending_posts(self, movie_codes, posted):
+        """Post natijasini yozish: muvaffaqiyatli bo'lsa navbatdan o'chirish, aks holda urinishlarni oshirish"""
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            if posted:
+                cur.execute('DELETE FROM pending_posts WHERE movie_code = ANY(%s)', (list(movie_codes),))
+            else:
+                cur.execute(
+                    'UPDATE pending_posts SET attempts = attempts + 1 WHERE movie_code = ANY(%s)',
+                    (list(movie_codes),)
+                )
+            conn.commit()
+            cur.close()
         except Exception as e:
-            logger.error(f"Add movie error: {e}")
+            logger.error(f"Finish pending posts error: {e}")
             conn.rollback()
-            return False
         finally:
             self.return_connection(conn)
 
@@ -118,10 +506,16 @@ class Database:
             cur = conn.cursor()
             # Avval bor yoki yo'qligini tekshirmaymiz, to'g'ridan-to'g'ri o'chiramiz
             cur.execute('DELETE FROM movies WHERE movie_code = %s', (movie_code,))
-            conn.commit()
-
             # Nechta qator o'chganini bilish (agar 0 bo'lsa, demak kino topilmagan)
             deleted_count = cur.rowcount
+            # Kod qayta ishlatilishi mumkin - eski ko'rishlar yangi kinoga o'tib ketmasin
+            cur.execute('DELETE FROM movie_views WHERE movie_code = %s', (movie_code,))
+            cur.execute('DELETE FROM movie_similar WHERE movie_code = %s', (movie_code,))
+            conn.commit()
+            self.search_cache.invalidate()
+            self.series_cache.invalidate()
+            self._forget_similar(movie_code)
+            self.movie_cache.invalidate(movie_code)
             cur.close()
             return deleted_count > 0
         except Exception as e:
@@ -132,25 +526,55 @@ class Database:
             self.return_connection(conn)
 
 
+    def _cache_version(self, conn, name):
+        """
+        Keshga yoziladigan ma'lumotni o'qishdan OLDIN chaqiriladi (o'sha ulanishda):
+        ma'lumot bu versiyadan eski bo'lmaydi, replica orqada qolsa ham snapshot uni yangi deb belgilamaydi.
+        """
+        cur = conn.cursor()
+        cur.execute('SELECT COALESCE(MAX(version), 0) FROM cache_versions WHERE name = %s', (name,))
+        version = cur.fetchone()[0]
+        cur.close()
+        return version
+
+    def _cache_movie(self, movie, version):
+        """Kinoni keshga yozish (views tez eskiradi va yuborish uchun kerak emas)"""
+        movie = {k: v for k, v in movie.items() if k != 'views'}
+        self.movie_cache.set(movie['movie_code'], movie, version)
+        return movie
+
+    @_replica_failover
     def get_movie_by_code(self, movie_code):
-        """Kod bo'yicha kinoni olish"""
-        conn = self.get_connection()
+        """Kod bo'yicha kinoni olish (topilganlari keshlanadi)"""
+        movie = self.movie_cache.get(movie_code)
+        if movie is not None:
+            return movie
+
+        conn = self.get_read_connection()
         try:
+            version = self._cache_version(conn, 'catalog')
             cur = conn.cursor(cursor_factory=RealDictCursor)
             cur.execute('SELECT * FROM movies WHERE movie_code = %s', (movie_code,))
             movie = cur.fetchone()
             cur.close()
-            return movie
+            return self._cache_movie(movie, version) if movie else None
         except Exception as e:
             logger.error(f"Get movie error: {e}")
             return None
         finally:
             self.return_connection(conn)
 
+    @_replica_failover
     def search_movie_by_name(self, name):
-        """Nom bo'yicha qidirish"""
-        conn = self.get_connection()
+        """Nom bo'yicha qidirish (natijalar keshlanadi)"""
+        cache_key = name.lower()
+        movies = self.search_cache.get(cache_key)
+        if movies is not None:
+            return movies
+
+        conn = self.get_read_connection()
         try:
+            version = self._cache_version(conn, 'catalog')
             cur = conn.cursor(cursor_factory=RealDictCursor)
             cur.execute(
                 'SELECT * FROM movies WHERE video_name ILIKE %s LIMIT 10',
@@ -158,6 +582,7 @@ class Database:
             )
             movies = cur.fetchall()
             cur.close()
+            self.search_cache.set(cache_key, movies, version)
             return movies
         except Exception as e:
             logger.error(f"Search error: {e}")
@@ -178,9 +603,46 @@ class Database:
         finally:
             self.return_connection(conn)
 
+    def add_movie_views(self, views):
+        """
+        Yuborilgan kinolarni bitta tranzaksiyada yozish: [(user_id, movie_code), ...].
+        movies.views oshiriladi va movie_views (co-view tavsiyalari uchun) yangilanadi.
+        """
+        counts = {}
+        for _, movie_code in views:
+            counts[movie_code] = counts.get(movie_code, 0) + 1
+
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            execute_values(
+                cur,
+                '''UPDATE movies SET views = movies.views + v.n
+                   FROM (VALUES %s) AS v(movie_code, n)
+                   WHERE movies.movie_code = v.movie_code''',
+                list(counts.items())
+            )
+            # Bitta batch ichida (user, kino) takrorlansa ON CONFLICT xato beradi - unikal qilamiz
+            execute_values(
+                cur,
+                '''INSERT INTO movie_views (user_id, movie_code) VALUES %s
+                   ON CONFLICT (user_id, movie_code) DO UPDATE SET viewed_at = CURRENT_TIMESTAMP''',
+                list(set(views))
+            )
+            conn.commit()
+            cur.close()
+            return True
+        except Exception as e:
+            logger.error(f"Movie views error: {e}")
+            conn.rollback()
+            return False
+        finally:
+            self.return_connection(conn)
+
+    @_replica_failover
     def get_all_movies(self, limit=50):
         """Kinolar ro'yxati"""
-        conn = self.get_connection()
+        conn = self.get_read_connection()
         try:
             cur = conn.cursor(cursor_factory=RealDictCursor)
             # Raqam bo'yicha to'g'ri tartiblash (Kodesiz, shunchaki id yoki added_at)
@@ -194,9 +656,10 @@ class Database:
         finally:
             self.return_connection(conn)
 
+    @_replica_failover
     def get_movies_count(self):
         """Jami kinolar soni"""
-        conn = self.get_connection()
+        conn = self.get_read_connection()
         try:
             cur = conn.cursor()
             cur.execute('SELECT COUNT(*) FROM movies')
@@ -207,34 +670,176 @@ class Database:
             return 0
         finally:
             self.return_connection(conn)
-    def get_last_code(self):
-            """Bazadagi eng katta raqamli kodni topish"""
-            conn = self.get_connection()
-            try:
-                cur = conn.cursor()
-                # Kodlarni raqamga aylantirib, eng kattasini olamiz
-                cur.execute("SELECT MAX(CAST(movie_code AS INTEGER)) FROM movies")
-                max_val = cur.fetchone()[0]
+
+    # ===== SERIES OPERATIONS =====
+
+    @_replica_failover
+    def get_missing_movie_codes(self, movie_codes):
+        """Bazada yo'q kino kodlarini qaytarish"""
+        conn = self.get_read_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                '''SELECT c FROM unnest(%s::varchar[]) AS c
+                   WHERE NOT EXISTS (SELECT 1 FROM movies WHERE movie_code = c)''',
+                (list(movie_codes),)
+            )
+            missing = [row[0] for row in cur.fetchall()]
+            cur.close()
+            return missing
+        except Exception as e:
+            logger.error(f"Missing codes error: {e}")
+            return list(movie_codes)
+        finally:
+            self.return_connection(conn)
+
+    def add_series(self, series_name, movie_codes):
+        """
+        Serial qo'shish: ota kod (kinolar bilan bir xil lock ostida ajratiladi) +
+        tartiblangan qismlar, bitta tranzaksiyada.
+        Qaytaradi: serial kodi yoki xatolikda None.
+        """
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            series_code = str(self._lock_last_code(cur) + 1)
+            cur.execute(
+                'INSERT INTO series (series_code, series_name) VALUES (%s, %s)',
+                (series_code, series_name)
+            )
+            cur.execute(
+                '''INSERT INTO series_parts (series_code, part_number, movie_code)
+                   SELECT %s, t.part_number, t.movie_code
+                   FROM unnest(%s::varchar[]) WITH ORDINALITY AS t(movie_code, part_number)''',
+                (series_code, list(movie_codes))
+            )
+            conn.commit()
+            cur.close()
+            return series_code
+        except psycopg2.IntegrityError:
+            conn.rollback()
+            return None
+        except Exception as e:
+            logger.error(f"Add series error: {e}")
+            conn.rollback()
+            return None
+        finally:
+            self.return_connection(conn)
+
+    @_replica_failover
+    def get_series_page(self, series_code, offset=0, limit=10):
+        """
+        Serialning bir sahifadagi qismlarini olish.
+        Qaytaradi: (serial, qismlar, jami_qismlar) yoki serial topilmasa None.
+        """
+        cache_key = (series_code, offset, limit)
+        page = self.series_cache.get(cache_key)
+        if page is not None:
+            return page
+
+        conn = self.get_read_connection()
+        try:
+            version = self._cache_version(conn, 'catalog')
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute(
+                '''SELECT s.*, (SELECT COUNT(*) FROM series_parts p WHERE p.series_code = s.series_code) AS total_parts
+                   FROM series s WHERE s.series_code = %s''',
+                (series_code,)
+            )
+            series = cur.fetchone()
+            if not series:
                 cur.close()
-                return max_val if max_val is not None else 0
-            except Exception:
-                return 0
-            finally:
-                self.return_connection(conn)
+                return None
+
+            cur.execute(
+                '''SELECT p.part_number, m.movie_code, m.video_id, m.video_name, m.caption
+                   FROM series_parts p
+                   JOIN movies m ON m.movie_code = p.movie_code
+                   WHERE p.series_code = %s
+                   ORDER BY p.part_number
+                   OFFSET %s LIMIT %s''',
+                (series_code, offset, limit)
+            )
+            parts = cur.fetchall()
+            cur.close()
+            page = (series, parts, series['total_parts'])
+            self.series_cache.set(cache_key, page, version)
+            return page
+        except Exception as e:
+            logger.error(f"Get series error: {e}")
+            return None
+        finally:
+            self.return_connection(conn)
+
+    def increment_series_views(self, series_code):
+        """Serial ko'rishlar sonini oshirish"""
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute('UPDATE series SET views = views + 1 WHERE series_code = %s', (series_code,))
+            conn.commit()
+            cur.close()
+        except Exception:
+            conn.rollback()
+        finally:
+            self.return_connection(conn)
+
+    def delete_series(self, series_code):
+        """Serialni o'chirish (qism kinolari o'chmaydi)"""
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute('DELETE FROM series WHERE series_code = %s', (series_code,))
+            conn.commit()
+            self.series_cache.invalidate()
+            deleted_count = cur.rowcount
+            cur.close()
+            return deleted_count > 0
+        except Exception as e:
+            logger.error(f"Delete series error: {e}")
+            conn.rollback()
+            return False
+        finally:
+            self.return_connection(conn)
+
+    def get_cache_versions(self):
+        """Kesh versiyalari: {'catalog': N, 'channels': M} (har doim primary dan)"""
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT name, version FROM cache_versions')
+            versions = dict(cur.fetchall())
+            cur.close()
+            return versions
+        except Exception as e:
+            logger.error(f"Cache versions error: {e}")
+            return None
+        finally:
+            self.return_connection(conn)
+
     # ===== USERS OPERATIONS =====
 
     def add_user(self, user_id):
+        """
+        Foydalanuvchini qo'shish (bor bo'lsa faolligini yangilash).
+        Qaytaradi: yangi foydalanuvchi bo'lsa True.
+        """
         conn = self.get_connection()
         try:
             cur = conn.cursor()
             cur.execute(
-                'INSERT INTO users (user_id) VALUES (%s) ON CONFLICT (user_id) DO NOTHING',
+                '''INSERT INTO users (user_id) VALUES (%s)
+                   ON CONFLICT (user_id) DO UPDATE SET last_active = CURRENT_TIMESTAMP
+                   RETURNING (xmax = 0) AS inserted''',
                 (user_id,)
             )
+            inserted = cur.fetchone()[0]
             conn.commit()
             cur.close()
+            return inserted
         except Exception:
             conn.rollback()
+            return False
         finally:
             self.return_connection(conn)
 
@@ -253,8 +858,62 @@ class Database:
         finally:
             self.return_connection(conn)
 
-    def get_users_count(self):
+    def touch_user_and_get_movie(self, user_id, movie_code=None):
+        """
+        Xabar uchun kerakli hamma narsa bitta so'rovda (bitta round-trip):
+        faollikni yangilash, majburiy kanallar va (kod bo'lsa) kino.
+        Ko'rish bu yerda sanalmaydi - video yuborilgandan keyin add_movie_views orqali.
+        Kanallar yoki kino keshda bo'lsa, so'rovda qayta o'qilmaydi (faqat faollik yangilanadi).
+        Qaytaradi: (kanallar, kino yoki None).
+        """
+        cached_channels = self.channels_cache.get('required')
+        cached_movie = self.movie_cache.get(movie_code) if movie_code else None
         conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                '''WITH activity AS (
+                       UPDATE users SET last_active = CURRENT_TIMESTAMP WHERE user_id = %(user_id)s
+                   ),
+                   movie AS (
+                       SELECT * FROM movies WHERE movie_code = %(movie_code)s
+                   )
+                   SELECT
+                       CASE WHEN %(need_channels)s THEN
+                           (SELECT COALESCE(json_agg(c), '[]'::json) FROM channels c
+                            WHERE c.required = TRUE AND c.is_active = TRUE)
+                       END AS channels,
+                       (SELECT row_to_json(m) FROM movie m) AS movie,
+                       -- Bitta so'rov = bitta snapshot: versiyalar ma'lumot bilan aynan mos
+                       (SELECT COALESCE(MAX(version), 0) FROM cache_versions WHERE name = 'catalog'),
+                       (SELECT COALESCE(MAX(version), 0) FROM cache_versions WHERE name = 'channels')''',
+                {
+                    'user_id': user_id,
+                    'movie_code': None if cached_movie is not None else movie_code,
+                    'need_channels': cached_channels is None
+                }
+            )
+            channels, movie, catalog_version, channels_version = cur.fetchone()
+            conn.commit()
+            cur.close()
+            if cached_movie is not None:
+                movie = cached_movie
+            elif movie:
+                movie = self._cache_movie(movie, catalog_version)
+            if cached_channels is not None:
+                return cached_channels, movie
+            self.channels_cache.set('required', channels, channels_version)
+            return channels, movie
+        except Exception as e:
+            logger.error(f"Hot path error: {e}")
+            conn.rollback()
+            return [], None
+        finally:
+            self.return_connection(conn)
+
+    @_replica_failover
+    def get_users_count(self):
+        conn = self.get_read_connection()
         try:
             cur = conn.cursor()
             cur.execute('SELECT COUNT(*) FROM users')
@@ -266,8 +925,9 @@ class Database:
         finally:
             self.return_connection(conn)
 
+    @_replica_failover
     def get_active_users_today(self):
-        conn = self.get_connection()
+        conn = self.get_read_connection()
         try:
             cur = conn.cursor()
             cur.execute("SELECT COUNT(*) FROM users WHERE last_active::date = CURRENT_DATE")
@@ -279,6 +939,221 @@ class Database:
         finally:
             self.return_connection(conn)
 
+    # ===== SIMILAR MOVIES =====
+
+    def rebuild_similar_movies(self, top_k=5, per_user=50, min_common=2):
+        """
+        Co-view bo'yicha o'xshash kinolarni qayta hisoblash (fon jobi uchun).
+        O'xshashlik: birga ko'rganlar / sqrt(A ko'rganlar * B ko'rganlar) (kosinus).
+        Har foydalanuvchining oxirgi per_user ta ko'rishi olinadi (juftliklar soni chegaralanadi).
+        Qaytaradi: yangilangan kinolar soni, boshqa jarayon hisoblayotgan bo'lsa None.
+        """
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            # Bir nechta jarayon bo'lsa - faqat bittasi hisoblaydi
+            cur.execute('SELECT pg_try_advisory_xact_lock(hashtext(%s))', ('similar_movies',))
+            if not cur.fetchone()[0]:
+                conn.rollback()
+                return None
+
+            # Eski ro'yxat tranzaksiya tugaguncha ko'rinib turadi
+            cur.execute('DELETE FROM movie_similar')
+            cur.execute(
+                '''WITH recent AS (
+                       SELECT user_id, movie_code FROM (
+                           SELECT v.user_id, v.movie_code,
+                                  row_number() OVER (PARTITION BY v.user_id ORDER BY v.viewed_at DESC) AS rn
+                           FROM movie_views v JOIN movies m ON m.movie_code = v.movie_code
+                       ) v
+                       WHERE rn <= %(per_user)s
+                   ),
+                   popularity AS (
+                       SELECT movie_code, COUNT(*) AS viewers FROM recent GROUP BY movie_code
+                   ),
+                   pairs AS (
+                       SELECT a.movie_code AS code, b.movie_code AS other, COUNT(*) AS together
+                       FROM recent a JOIN recent b ON a.user_id = b.user_id AND a.movie_code <> b.movie_code
+                       GROUP BY a.movie_code, b.movie_code
+                       HAVING COUNT(*) >= %(min_common)s
+                   ),
+                   ranked AS (
+                       SELECT p.code, p.other,
+                              row_number() OVER (
+                                  PARTITION BY p.code
+                                  ORDER BY p.together / sqrt(pa.viewers * pb.viewers) DESC, p.together DESC
+                              ) AS rank
+                       FROM pairs p
+                       JOIN popularity pa ON pa.movie_code = p.code
+                       JOIN popularity pb ON pb.movie_code = p.other
+                   )
+                   INSERT INTO movie_similar (movie_code, neighbours)
+                   SELECT code, array_agg(other ORDER BY rank) FROM ranked
+                   WHERE rank <= %(top_k)s
+                   GROUP BY code''',
+                {'top_k': top_k, 'per_user': per_user, 'min_common': min_common}
+            )
+            updated = cur.rowcount
+            conn.commit()
+            cur.close()
+            return updated
+        except Exception as e:
+            logger.error(f"Rebuild similar movies error: {e}")
+            conn.rollback()
+            return 0
+        finally:
+            self.return_connection(conn)
+
+    def get_similar_movies_age(self):
+        """Oxirgi rebuild'dan beri o'tgan soniyalar (hali hisoblanmagan bo'lsa None)"""
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT EXTRACT(EPOCH FROM LOCALTIMESTAMP - MAX(updated_at)) FROM movie_similar')
+            age = cur.fetchone()[0]
+            conn.commit()
+            cur.close()
+            return float(age) if age is not None else None
+        except Exception as e:
+            logger.error(f"Similar movies age error: {e}")
+            conn.rollback()
+            return None
+        finally:
+            self.return_connection(conn)
+
+    @_replica_failover
+    def warm_similar_cache(self):
+        """Hamma tavsiyalarni keshga yuklash - xabar paytida bazaga murojaat bo'lmasin"""
+        conn = self.get_read_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                '''SELECT s.movie_code,
+                          COALESCE(json_agg(json_build_object('movie_code', m.movie_code, 'video_name', m.video_name)
+                                            ORDER BY n.rank) FILTER (WHERE m.movie_code IS NOT NULL), '[]'::json)
+                   FROM movie_similar s
+                   CROSS JOIN LATERAL unnest(s.neighbours) WITH ORDINALITY AS n(code, rank)
+                   LEFT JOIN movies m ON m.movie_code = n.code
+                   GROUP BY s.movie_code'''
+            )
+            rows = cur.fetchall()
+            cur.close()
+            # Eski ro'yxatlar (endi tavsiyasi yo'q kinolar) qolib ketmasin
+            self.similar_cache.invalidate()
+            for movie_code, similar in rows:
+                self.similar_cache.set(movie_code, similar)
+            return len(rows)
+        except Exception as e:
+            logger.error(f"Warm similar cache error: {e}")
+            return 0
+        finally:
+            self.return_connection(conn)
+
+    def _forget_similar(self, movie_code):
+        """O'chirilgan kinoning tavsiyalari va boshqa kinolar ostidagi tugmasi keshdan olinadi (qolganlari saqlanadi)"""
+        self.similar_cache.invalidate(movie_code)
+        for key, _, similar, version in self.similar_cache.dump():
+            if any(m['movie_code'] == movie_code for m in similar):
+                self.similar_cache.set(key, [m for m in similar if m['movie_code'] != movie_code], version)
+
+    # ===== ACTIVITY BITMAPS =====
+
+    def merge_activity_bitmap(self, kind, day, user_ids):
+        """
+        user_ids ni shu kunning bitmapiga qo'shish (OR). Qator lock qilinadi,
+        shuning uchun bir nechta jarayon parallel yozsa ham bitlar yo'qolmaydi.
+        """
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT seq FROM users WHERE user_id = ANY(%s)', (list(user_ids),))
+            seqs = [row[0] for row in cur.fetchall()]
+            buf = bytearray(max(seqs, default=0) // 8 + 1)
+            for seq in seqs:
+                buf[seq >> 3] |= 1 << (seq & 7)
+            new_bits = int.from_bytes(buf, 'little')
+
+            cur.execute(
+                '''INSERT INTO activity_bitmaps (kind, day) VALUES (%s, %s)
+                   ON CONFLICT (kind, day) DO NOTHING''',
+                (kind, day)
+            )
+            cur.execute(
+                'SELECT bitmap FROM activity_bitmaps WHERE kind = %s AND day = %s FOR UPDATE',
+                (kind, day)
+            )
+            bits = int.from_bytes(bytes(cur.fetchone()[0]), 'little') | new_bits
+            cur.execute(
+                'UPDATE activity_bitmaps SET bitmap = %s WHERE kind = %s AND day = %s',
+                (psycopg2.Binary(bits.to_bytes((bits.bit_length() + 7) // 8, 'little')), kind, day)
+            )
+            conn.commit()
+            cur.close()
+            return True
+        except Exception as e:
+            logger.error(f"Activity bitmap error: {e}")
+            conn.rollback()
+            return False
+        finally:
+            self.return_connection(conn)
+
+    def get_activity_bitmaps(self, kind, first_day, last_day):
+        """Kunlik bitmaplar: {sana: int} (bit i = users.seq)"""
+        # Hisobotdan oldin flush qilinadi - replika lag'i tufayli yangi bitlar ko'rinmasligi mumkin
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                'SELECT day, bitmap FROM activity_bitmaps WHERE kind = %s AND day BETWEEN %s AND %s',
+                (kind, first_day, last_day)
+            )
+            bitmaps = {day: int.from_bytes(bytes(bitmap), 'little') for day, bitmap in cur.fetchall()}
+            cur.close()
+            return bitmaps
+        except Exception as e:
+            logger.error(f"Get activity bitmaps error: {e}")
+            return {}
+        finally:
+            self.return_connection(conn)
+
+    # ===== DEEP-LINK OPERATIONS =====
+
+    def add_deeplink_hits(self, counts):
+        """Yig'ilgan bosishlarni bitta so'rovda qo'shish: {payload: son}"""
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            execute_values(
+                cur,
+                '''INSERT INTO deeplink_hits (payload, hits) VALUES %s
+                   ON CONFLICT (payload) DO UPDATE
+                   SET hits = deeplink_hits.hits + EXCLUDED.hits, last_hit = CURRENT_TIMESTAMP''',
+                list(counts.items())
+            )
+            conn.commit()
+            cur.close()
+            return True
+        except Exception as e:
+            logger.error(f"Deeplink hits error: {e}")
+            conn.rollback()
+            return False
+        finally:
+            self.return_connection(conn)
+
+    @_replica_failover
+    def get_top_deeplinks(self, limit=10):
+        conn = self.get_read_connection()
+        try:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute('SELECT payload, hits, last_hit FROM deeplink_hits ORDER BY hits DESC LIMIT %s', (limit,))
+            links = cur.fetchall()
+            cur.close()
+            return links
+        except Exception:
+            return []
+        finally:
+            self.return_connection(conn)
+
     # ===== CHANNELS OPERATIONS =====
 
     def add_channel(self, channel_id, channel_username, required=True):
@@ -291,6 +1166,7 @@ class Database:
             )
             conn.commit()
             cur.close()
+            self.channels_cache.invalidate()
             return True
         except psycopg2.IntegrityError:
             conn.rollback()
@@ -298,13 +1174,20 @@ class Database:
         finally:
             self.return_connection(conn)
 
+    @_replica_failover
     def get_required_channels(self):
-        conn = self.get_connection()
+        channels = self.channels_cache.get('required')
+        if channels is not None:
+            return channels
+
+        conn = self.get_read_connection()
         try:
+            version = self._cache_version(conn, 'channels')
             cur = conn.cursor(cursor_factory=RealDictCursor)
             cur.execute('SELECT * FROM channels WHERE required = TRUE AND is_active = TRUE')
             channels = cur.fetchall()
             cur.close()
+            self.channels_cache.set('required', channels, version)
             return channels
         except Exception:
             return []
@@ -317,6 +1200,7 @@ class Database:
             cur = conn.cursor()
             cur.execute('DELETE FROM channels WHERE channel_id = %s', (channel_id,))
             conn.commit()
+            self.channels_cache.invalidate()
             affected = cur.rowcount
             cur.close()
             return affected > 0
@@ -326,8 +1210,9 @@ class Database:
         finally:
             self.return_connection(conn)
 
+    @_replica_failover
     def get_all_channels(self):
-        conn = self.get_connection()
+        conn = self.get_read_connection()
         try:
             cur = conn.cursor(cursor_factory=RealDictCursor)
             cur.execute('SELECT * FROM channels ORDER BY id')
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import time
+
+from telegram import InputMediaVideo
+from telegram.constants import ParseMode
+from telegram.error import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+
+class _Batch:
+    """Bitta albom (yoki bitta video) uchun yig'ilgan elementlar"""
+
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+        self.items = []  # [(video_id, video_name, caption), ...]
+        self.last_added = time.monotonic()
+        self.task = None
+
+
+class IngestQueue:
+    """
+    Admin yuborgan videolarni navbatga qo'yadi:
+    albom elementlarini media_group_id bo'yicha yig'adi, bazaga bitta batch bilan yozadi
+    va kanalga fonda (qayta urinishlar bilan) joylaydi.
+
+    Kanal navbati bazada (pending_posts) saqlanadi, bot qayta ishga tushsa davom etadi.
+    To'xtashda (stop) hali kutilayotgan albomlar darhol bazaga yoziladi.
+    """
+
+    def __init__(self, db, channel_id, bot_username, group_delay=1.5, max_attempts=5, claim_unassigned=False):
+        self.db = db
+        self.channel_id = channel_id
+        self.bot_username = bot_username
+        # Kanali yozilmagan eski pending_posts qatorlarini shu navbat oladi (faqat birinchi bot)
+        self.claim_unassigned = claim_unassigned
+        # Albomning oxirgi elementidan keyin shuncha soniya kutib, batch yopiladi
+        self.group_delay = group_delay
+        self.max_attempts = max_attempts
+
+        self._batches = {}
+        self._flushing = set()  # bazaga yozilayotgan batch vazifalari
+        self._posts = asyncio.Queue()
+        self._worker = None
+
+    async def start(self, bot):
+        """Fon workerini ishga tushirish va joylanmay qolgan postlarni navbatga qaytarish"""
+        self._worker = asyncio.create_task(self._post_worker(bot))
+
+        pending = await asyncio.to_thread(self.db.get_pending_posts, self.channel_id, self.claim_unassigned)
+        groups = {}
+        for post in pending:
+            groups.setdefault(post['group_key'], []).append(post)
+        for movies in groups.values():
+            self._posts.put_nowait((movies, None))
+        if groups:
+            logger.info(f"Ingest: {len(pending)} ta joylanmagan post navbatga qaytarildi")
+
+    async def stop(self, bot):
+        """Kutilayotgan albomlarni kutmasdan bazaga yozish (qabul qilingan video yo'qolmasin)"""
+        waiting = list(self._batches)
+        for group_key in waiting:
+            # Batch hali _batches da bo'lsa, vazifa faqat kutish (sleep) holatida - bekor qilish xavfsiz
+            self._batches[group_key].task.cancel()
+        await asyncio.gather(
+            *(self._flush(bot, group_key) for group_key in waiting),
+            *self._flushing,
+            return_exceptions=True
+        )
+        if self._worker is not None:
+            # Joylanmagan postlar pending_posts da qoladi - keyingi ishga tushishda davom etadi
+            self._worker.cancel()
+            self._worker = None
+
+    def add(self, bot, chat_id, group_key, video_id, video_name, caption):
+        """
+        Videoni navbatga qo'shish (darhol qaytadi).
+        Qaytaradi: True - agar bu guruhning birinchi elementi bo'lsa (admin'ga tasdiq yuborish uchun).
+        """
+        batch = self._batches.get(group_key)
+        is_new = batch is None
+        if is_new:
+            batch = self._batches[group_key] = _Batch(chat_id)
+            batch.task = asyncio.create_task(self._flush_when_complete(bot, group_key))
+
+        batch.items.append((video_id, video_name, caption))
+        batch.last_added = time.monotonic()
+        return is_new
+
+    async def _flush_when_complete(self, bot, group_key):
+        batch = self._batches[group_key]
+        # Albomning qolgan elementlari kelishini kutamiz
+        while True:
+            remaining = batch.last_added + self.group_delay - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(remaining)
+
+        task = asyncio.current_task()
+        self._flushing.add(task)
+        try:
+            await self._flush(bot, group_key)
+        finally:
+            self._flushing.discard(task)
+
+    async def _flush(self, bot, group_key):
+        batch = self._batches.pop(group_key)
+        try:
+            codes = await asyncio.to_thread(self.db.add_movies_batch, batch.items, group_key, self.channel_id)
+        except Exception as e:
+            logger.error(f"Ingest flush error: {e}")
+            codes = None
+        if not codes:
+            # Admin bilishi kerak - aks holda "Qabul qilindi" dan keyin video jimgina yo'qoladi
+            try:
+                await bot.send_message(
+                    chat_id=batch.chat_id,
+                    text=f"❌ Bazaga yozishda xatolik! {len(batch.items)} ta video saqlanmadi, qaytadan yuboring."
+                )
+            except Exception as e:
+                logger.error(f"Ingest: {len(batch.items)} ta video saqlanmadi va admin'ga xabar yuborilmadi: {e}")
+            return
+
+        movies = [
+            {'movie_code': code, 'video_id': video_id, 'video_name': video_name, 'caption': caption}
+            for code, (video_id, video_name, caption) in zip(codes, batch.items)
+        ]
+        self._posts.put_nowait((movies, batch.chat_id))
+
+    async def _post_worker(self, bot):
+        while True:
+            movies, chat_id = await self._posts.get()
+            try:
+                posted = await self._post_with_retry(bot, movies)
+                codes = [m['movie_code'] for m in movies]
+                await asyncio.to_thread(self.db.finish_pending_posts, codes, posted)
+                if chat_id:
+                    await self._send_summary(bot, chat_id, movies, posted)
+            except Exception as e:
+                logger.error(f"Ingest worker error: {e}")
+            finally:
+                self._posts.task_done()
+
+    async def _post_with_retry(self, bot, movies):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await self._post_to_channel(bot, movies)
+                return True
+            except RetryAfter as e:
+                delay = e.retry_after
+                delay = delay.total_seconds() if hasattr(delay, 'total_seconds') else delay
+            except Exception as e:
+                delay = 2 ** attempt
+                logger.warning(f"Channel post failed (attempt {attempt}/{self.max_attempts}): {e}")
+            if attempt < self.max_attempts:
+                await asyncio.sleep(delay)
+        return False
+
+    async def _post_to_channel(self, bot, movies):
+        # Deep-link: bosilganda bot kinoni darhol yuboradi (kodni yozish shart emas)
+        bot_link = f"https://t.me/{self.bot_username.lstrip('@')}?start="
+        captions = [
+            f"{m['caption']}\n\n🆔 Kod: {m['movie_code']}\n"
+            f"▶️ <a href=\"{bot_link}{m['movie_code']}\">Botda ko'rish</a>\n🤖 {self.bot_username}"
+            for m in movies
+        ]
+        if len(movies) == 1:
+            await bot.send_video(
+                chat_id=self.channel_id,
+                video=movies[0]['video_id'],
+                caption=captions[0],
+                parse_mode=ParseMode.HTML
+            )
+            return
+
+        # Albom - bitta so'rovda (Telegram chegarasi: 10 ta)
+        for start in range(0, len(movies), 10):
+            media = [
+                InputMediaVideo(media=m['video_id'], caption=caption, parse_mode=ParseMode.HTML)
+                for m, caption in zip(movies[start:start + 10], captions[start:start + 10])
+            ]
+            await bot.send_media_group(chat_id=self.channel_id, media=media)
+
+    async def _send_summary(self, bot, chat_id, movies, posted):
+        lines = "\n".join(f"🆔 <code>{m['movie_code']}</code> — {m['video_name']}" for m in movies)
+        status = (
+            "<i>Kanalga joylandi.</i>" if posted
+            else "⚠️ <i>Kanalga joylab bo'lmadi, bot qayta ishga tushganda yana urinadi.</i>"
+        )
+        await bot.send_message(
+            chat_id=chat_id,
+            text=f"✅ <b>{len(movies)} ta kino qo'shildi!</b>\n\n{lines}\n\n{status}",
+            parse_mode=ParseMode.HTML
+        )
@@ -0,0 +1,384 @@
+"""
+Botni haqiqiy Telegram'siz yuklama ostida sinash.
+
+bot.py dagi haqiqiy Application lokal soxta Bot API serverga ulanadi:
+server getUpdates orqali sintetik (yoki yozib olingan) update'larni beradi,
+sendVideo / sendMessage / getChatMember va boshqa chaqiruvlarni qabul qilib yozib boradi,
+kerak bo'lsa kechikish va 429 xatolarini qo'shadi.
+
+Har bir update uchun latency = update getUpdates orqali berilgandan
+bot shu foydalanuvchiga birinchi javob yuborguncha bo'lgan vaqt.
+
+Ishlatish (lokal Postgres bilan):
+    DATABASE_URL=postgres://localhost/kino_test python loadtest.py --updates 2000 --latency-ms 30 --rate-429 0.01
+    python loadtest.py --replay updates.jsonl     # yozib olingan update'lar (har qatorda bitta JSON)
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+import statistics
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+# bot.py import qilinganda shu o'zgaruvchilar kerak bo'ladi
+os.environ.setdefault('BOT_TOKEN', '123456:LOADTEST')
+os.environ.setdefault('ADMIN_ID', '1')
+os.environ.setdefault('CHANNEL_ID', '-1000000000001')
+
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'Kino', 'username': 'AF_kino_bot'}
+USER_ID_BASE = 10 ** 9
+
+
+class FakeBotAPI:
+    """Telegram Bot API'ning lokal soxta versiyasi (stdlib HTTP server, alohida threadda)"""
+
+    def __init__(self, latency_ms=0, rate_429=0.0, member_status='member'):
+        self.latency = latency_ms / 1000
+        self.rate_429 = rate_429
+        self.member_status = member_status
+
+        self.calls = []  # [(vaqt, method, parametrlar)]
+        self.calls_by_method = Counter()
+        self.injected_429 = 0
+
+        self._updates = []
+        self._cond = threading.Condition()
+        self._message_id = 0
+        self._lock = threading.Lock()
+
+        self.delivered_at = {}   # update kaliti -> getUpdates berilgan vaqt
+        self.answered_at = {}    # update kaliti -> birinchi javob vaqti
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/bot"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+    def push_updates(self, updates):
+        with self._cond:
+            self._updates.extend(updates)
+            self._cond.notify_all()
+
+    # ===== Bot API metodlari =====
+
+    def _next_message(self, chat_id):
+        with self._lock:
+            self._message_id += 1
+            message_id = self._message_id
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id), 'type': 'private'},
+            'from': BOT_USER,
+        }
+
+    def _get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            # offset dan kichik update'lar tasdiqlangan - ularni tashlab yuboramiz
+            self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            while not self._updates and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            batch = self._updates[:limit]
+
+        now = time.perf_counter()
+        for update in batch:
+            self.delivered_at.setdefault(update_key(update), now)
+        return batch
+
+    def _dispatch(self, method, params):
+        if method == 'getUpdates':
+            return self._get_updates(params)
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'getChatMember':
+            user = {'id': int(params['user_id']), 'is_bot': False, 'first_name': 'Load'}
+            return {'status': self.member_status, 'user': user}
+        if method in ('sendMessage', 'sendVideo', 'editMessageReplyMarkup', 'editMessageText'):
+            return self._next_message(params.get('chat_id', 0))
+        if method == 'sendMediaGroup':
+            media = params.get('media') or []
+            return [self._next_message(params['chat_id']) for _ in media]
+        return True
+
+    def _record(self, method, params):
+        now = time.perf_counter()
+        with self._lock:
+            self.calls.append((now, method, params))
+            self.calls_by_method[method] += 1
+
+        key = None
+        if 'callback_query_id' in params:
+            key = int(params['callback_query_id'])
+        elif 'chat_id' in params and method != 'getChatMember':
+            key = int(params['chat_id']) - USER_ID_BASE
+        if key is not None:
+            self.answered_at.setdefault(key, now)
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                method = self.path.rsplit('/', 1)[-1]
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                params = parse_params(self.headers.get('Content-Type', ''), body)
+
+                if method not in ('getUpdates', 'getMe', 'deleteWebhook'):
+                    if api.latency:
+                        time.sleep(api.latency)
+                    if api.rate_429 and random.random() < api.rate_429:
+                        with api._lock:
+                            api.injected_429 += 1
+                        return self._reply(429, {
+                            'ok': False, 'error_code': 429,
+                            'description': 'Too Many Requests: retry after 1',
+                            'parameters': {'retry_after': 1},
+                        })
+                    api._record(method, params)
+
+                self._reply(200, {'ok': True, 'result': api._dispatch(method, params)})
+
+            do_GET = do_POST
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+def parse_params(content_type, body):
+    """Bot API so'rov parametrlari (form yoki JSON); qiymatlar JSON bo'lsa ochiladi"""
+    if not body:
+        return {}
+    if content_type.startswith('application/json'):
+        return json.loads(body)
+    if content_type.startswith('multipart/'):
+        return {}
+
+    params = {}
+    for key, values in parse_qs(body.decode(), keep_blank_values=True).items():
+        try:
+            params[key] = json.loads(values[0])
+        except ValueError:
+            params[key] = values[0]
+    return params
+
+
+def update_key(update):
+    return update['update_id']
+
+
+# ===== UPDATE GENERATORI =====
+
+def _user(update_id):
+    return {'id': USER_ID_BASE + update_id, 'is_bot': False, 'first_name': 'Load'}
+
+
+def _message(update_id, text, entities=None):
+    user = _user(update_id)
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user['id'], 'type': 'private'},
+        'from': user,
+        'text': text,
+    }
+    if entities:
+        message['entities'] = entities
+    return {'update_id': update_id, 'message': message}
+
+
+def make_update(update_id, kind, value=None):
+    """kind: code | search | start | check_subs"""
+    if kind == 'start':
+        return _message(update_id, '/start', [{'type': 'bot_command', 'offset': 0, 'length': 6}])
+    if kind == 'check_subs':
+        user = _user(update_id)
+        return {
+            'update_id': update_id,
+            'callback_query': {
+                'id': str(update_id),
+                'from': user,
+                'chat_instance': 'loadtest',
+                'data': 'check_subs',
+                'message': {
+                    'message_id': update_id,
+                    'date': int(time.time()),
+                    'chat': {'id': user['id'], 'type': 'private'},
+                    'from': BOT_USER,
+                    'text': 'Obunani tekshirish',
+                },
+            },
+        }
+    return _message(update_id, value)
+
+
+def update_kind(update):
+    if 'callback_query' in update:
+        return 'check_subs'
+    text = update['message'].get('text', '')
+    if text.startswith('/start'):
+        return 'start'
+    return 'code' if text.isdigit() else 'search'
+
+
+def synthetic_updates(count, codes, words, mix):
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    updates = []
+    for update_id in range(1, count + 1):
+        kind = random.choices(kinds, weights)[0]
+        value = random.choice(codes) if kind == 'code' else random.choice(words)
+        updates.append(make_update(update_id, kind, value))
+    return updates
+
+
+def recorded_updates(path):
+    """
+    JSONL fayldan update'lar. update_id va foydalanuvchi ID lari qayta beriladi,
+    shunda har bir update'ning javobini alohida o'lchash mumkin.
+    """
+    updates = []
+    with open(path, encoding='utf-8') as f:
+        for update_id, line in enumerate((l for l in f if l.strip()), start=1):
+            raw = json.loads(line)
+            if 'callback_query' in raw:
+                updates.append(make_update(update_id, 'check_subs'))
+            else:
+                text = raw.get('message', raw).get('text', '')
+                kind = 'start' if text.startswith('/start') else None
+                updates.append(make_update(update_id, kind, text))
+    return updates
+
+
+# ===== HISOBOT =====
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def report(api, updates, elapsed):
+    by_kind = defaultdict(list)
+    missing = Counter()
+    for update in updates:
+        key = update_key(update)
+        kind = update_kind(update)
+        if key in api.answered_at and key in api.delivered_at:
+            by_kind[kind].append((api.answered_at[key] - api.delivered_at[key]) * 1000)
+        else:
+            missing[kind] += 1
+
+    answered = sum(len(v) for v in by_kind.values())
+    print(f"\nUpdate'lar: {len(updates)}, javob berildi: {answered}, vaqt: {elapsed:.2f}s, "
+          f"{answered / elapsed:.1f} updates/s")
+    print(f"{'tur':>12} {'soni':>6} {'p50 ms':>9} {'p99 ms':>9} {'javobsiz':>9}")
+    for kind in sorted(set(by_kind) | set(missing)):
+        latencies = by_kind.get(kind) or [0.0]
+        print(f"{kind:>12} {len(by_kind.get(kind, [])):>6} {statistics.median(latencies):>9.1f} "
+              f"{percentile(latencies, 0.99):>9.1f} {missing[kind]:>9}")
+
+    print(f"\nBot API chaqiruvlari (429 qo'shildi: {api.injected_429}):")
+    for method, count in api.calls_by_method.most_common():
+        print(f"  {method:<24} {count}")
+
+
+# ===== MAIN =====
+
+async def run(args):
+    import bot
+    from config import load_bot_configs
+
+    api = FakeBotAPI(args.latency_ms, args.rate_429, args.member_status)
+    api.start()
+
+    if args.replay:
+        updates = recorded_updates(args.replay)
+    else:
+        movies = await asyncio.to_thread(bot.db.get_all_movies, 200)
+        codes = [m['movie_code'] for m in movies] or ['1']
+        words = [w for m in movies for w in (m['video_name'] or '').split() if len(w) > 2] or ['kino']
+        mix = {'code': args.mix_code, 'search': args.mix_search, 'start': args.mix_start, 'check_subs': args.mix_check_subs}
+        updates = synthetic_updates(args.updates, codes, words, mix)
+
+    config = load_bot_configs()[0]
+    application = bot.build_application(config, base_url=api.base_url)
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        await application.updater.start_polling(poll_interval=0, timeout=1)
+
+        started = time.perf_counter()
+        api.push_updates(updates)
+
+        # Hamma update'ga javob kelguncha (yoki vaqt tugaguncha) kutamiz
+        deadline = time.monotonic() + args.max_wait
+        while len(api.answered_at) < len(updates) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+
+        await application.updater.stop()
+        await application.stop()
+        # run_bots/run_polling kabi: bot hali ishlayotganda kutilayotgan yuklamalar yoziladi
+        if application.post_stop:
+            await application.post_stop(application)
+    # Fon vazifalari to'xtatiladi, yig'ilgan ko'rishlar/faollik bazaga yoziladi
+    if application.post_shutdown:
+        await application.post_shutdown(application)
+
+    api.stop()
+    report(api, updates, elapsed)
+    if args.dump_calls:
+        with open(args.dump_calls, 'w', encoding='utf-8') as f:
+            for at, method, params in api.calls:
+                f.write(json.dumps({'t': at, 'method': method, 'params': params}, ensure_ascii=False, default=str) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kino bot yuklama testi (soxta Bot API bilan)")
+    parser.add_argument('--updates', type=int, default=1000, help="sintetik update'lar soni")
+    parser.add_argument('--replay', help="yozib olingan update'lar (JSONL)")
+    parser.add_argument('--latency-ms', type=float, default=0, help="har bir Bot API chaqiruviga kechikish")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="429 qaytarish ehtimoli (0..1)")
+    parser.add_argument('--member-status', default='member', help="getChatMember javobi (member/left/...)")
+    parser.add_argument('--mix-code', type=float, default=0.7)
+    parser.add_argument('--mix-search', type=float, default=0.15)
+    parser.add_argument('--mix-start', type=float, default=0.1)
+    parser.add_argument('--mix-check-subs', type=float, default=0.05)
+    parser.add_argument('--max-wait', type=float, default=120, help="javoblarni kutish chegarasi (soniya)")
+    parser.add_argument('--dump-calls', help="barcha chaqiruvlarni shu JSONL faylga yozish")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
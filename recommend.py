@@ -0,0 +1,66 @@
+import os
+import asyncio
+import logging
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+logger = logging.getLogger(__name__)
+
+
+class SimilarMovies:
+    """
+    "Sizga yoqishi mumkin" tavsiyalari: co-view o'xshashliklari fon jobida
+    (bazada, bitta set-based so'rov bilan) hisoblanadi va keshga to'liq yuklanadi.
+    Xabar paytida faqat keshdan o'qiladi.
+    """
+
+    def __init__(self, db, interval=None, top_k=None):
+        self.db = db
+        self.interval = interval or float(os.getenv('SIMILAR_MOVIES_INTERVAL', '3600'))
+        self.top_k = top_k or int(os.getenv('SIMILAR_MOVIES_TOP_K', '5'))
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def refresh(self):
+        updated = await asyncio.to_thread(self.db.rebuild_similar_movies, self.top_k)
+        # Boshqa jarayon hisoblagan bo'lsa ham (None) - uning natijasini keshga olamiz
+        cached = await asyncio.to_thread(self.db.warm_similar_cache)
+        logger.info(f"Similar movies: {updated} ta qayta hisoblandi, {cached} ta keshda")
+
+    async def _run(self):
+        # Restartda og'ir co-view hisoblash qilinmaydi - avvalgi natija keshga olinadi,
+        # qayta hisoblash faqat movie_similar interval'dan eskirganda
+        try:
+            await asyncio.to_thread(self.db.warm_similar_cache)
+        except Exception as e:
+            logger.error(f"Similar movies warm error: {e}")
+
+        while True:
+            wait = self.interval
+            try:
+                age = await asyncio.to_thread(self.db.get_similar_movies_age)
+                if age is None or age >= self.interval:
+                    await self.refresh()
+                else:
+                    wait = self.interval - age
+            except Exception as e:
+                logger.error(f"Similar movies job error: {e}")
+            await asyncio.sleep(wait)
+
+    def keyboard(self, movie_code):
+        """Kino ostidagi tugmalar (tavsiya bo'lmasa None). Faqat keshdan o'qiydi"""
+        similar = self.db.similar_cache.get(movie_code)
+        if not similar:
+            return None
+        return InlineKeyboardMarkup([
+            [InlineKeyboardButton(f"🍿 {m['video_name'] or m['movie_code']}"[:60], callback_data=f"similar_{m['movie_code']}")]
+            for m in similar
+        ])
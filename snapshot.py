@@ -0,0 +1,159 @@
+import os
+import mmap
+import json
+import time
+import struct
+import pickle
+import asyncio
+import logging
+
+from utils import subscription_cache, last_known_status
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"KINOSNP2"
+_HEADER_LEN = struct.Struct('<I')
+
+
+def _plain(value):
+    """RealDictRow va boshqa dict/list turlarini oddiy dict/list/tuple ga aylantirish (pickle uchun)"""
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    if isinstance(value, tuple):
+        return tuple(_plain(v) for v in value)
+    return value
+
+
+class CacheSnapshotter:
+    """
+    Issiq keshlarni faylga saqlab, restartdan keyin tiklaydi.
+
+    Fayl: MAGIC | header uzunligi | JSON header | bo'limlar (har biri alohida pickle).
+    Har bir yozuv keshlangan paytdagi DB versiyasi (cache_versions) bilan saqlanadi -
+    versiya ma'lumotdan oldin (o'sha ulanishda) o'qilgani uchun replica lag'i uni yangi ko'rsatmaydi.
+    Header'da bo'limdagi versiyalar ro'yxati yoziladi. Yuklashda fayl mmap qilinadi va faqat
+    hozirgi versiyadagi yozuvlari bor bo'limlar o'qiladi, eskirganlari diskdan umuman o'qilmaydi.
+    """
+
+    def __init__(self, db, path=None, interval=None):
+        self.db = db
+        self.path = path or os.getenv('CACHE_SNAPSHOT_PATH', 'cache_snapshot.bin')
+        self.interval = interval or float(os.getenv('CACHE_SNAPSHOT_INTERVAL', '300'))
+        self._task = None
+        self._stopped = False
+
+    def _sections(self):
+        # bo'lim nomi -> (kesh, cache_versions dagi versiya nomi yoki None - faqat TTL bo'yicha)
+        return {
+            'channels': (self.db.channels_cache, 'channels'),
+            'movies': (self.db.movie_cache, 'catalog'),
+            'search': (self.db.search_cache, 'catalog'),
+            'series': (self.db.series_cache, 'catalog'),
+            'subscriptions': (subscription_cache, None),
+            'subscriptions_last_known': (last_known_status, None),
+        }
+
+    def start(self):
+        """Fonda: avval snapshot'ni yuklash, keyin har interval soniyada saqlash (bir marta chaqiriladi)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Graceful shutdown: oxirgi snapshot'ni yozish"""
+        if self._stopped:
+            return
+        self._stopped = True
+        if self._task is not None:
+            self._task.cancel()
+        try:
+            await asyncio.to_thread(self.save)
+        except Exception as e:
+            logger.error(f"Cache snapshot save error: {e}")
+
+    async def _run(self):
+        try:
+            await asyncio.to_thread(self.load)
+        except Exception as e:
+            logger.error(f"Cache snapshot load error: {e}")
+
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.save)
+            except Exception as e:
+                logger.error(f"Cache snapshot save error: {e}")
+
+    def save(self):
+        sections = {}
+        blobs = []
+        offset = 0
+        for name, (cache, version_name) in self._sections().items():
+            entries = [
+                (key, ttl, _plain(value), version) for key, ttl, value, version in cache.dump()
+                # Versiyasi noma'lum yozuvni keyin tekshirib bo'lmaydi
+                if version is not None or not version_name
+            ]
+            blob = pickle.dumps(entries, protocol=pickle.HIGHEST_PROTOCOL)
+            sections[name] = {
+                'offset': offset,
+                'length': len(blob),
+                'versions': sorted({e[3] for e in entries}) if version_name else None,
+                'entries': len(entries),
+            }
+            blobs.append(blob)
+            offset += len(blob)
+
+        header = json.dumps({'written_at': time.time(), 'sections': sections}).encode()
+
+        # Avval vaqtinchalik faylga, keyin atomik almashtirish (yarim yozilgan fayl qolmasin)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(_HEADER_LEN.pack(len(header)))
+            f.write(header)
+            for blob in blobs:
+                f.write(blob)
+        os.replace(tmp_path, self.path)
+        counts = {name: meta['entries'] for name, meta in sections.items()}
+        logger.info(f"Cache snapshot saqlandi: {counts}")
+
+    def load(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < len(MAGIC) + _HEADER_LEN.size:
+            return
+
+        versions = self.db.get_cache_versions()
+        sections = self._sections()
+        loaded = {}
+
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:len(MAGIC)] != MAGIC:
+                logger.warning("Cache snapshot formati noto'g'ri, tashlab yuborildi")
+                return
+            (header_len,) = _HEADER_LEN.unpack_from(mm, len(MAGIC))
+            base = len(MAGIC) + _HEADER_LEN.size
+            header = json.loads(mm[base:base + header_len])
+            base += header_len
+            age = max(0.0, time.time() - header['written_at'])
+
+            with memoryview(mm) as view:
+                for name, meta in header['sections'].items():
+                    if name not in sections:
+                        continue
+                    cache, version_name = sections[name]
+                    if not meta['entries']:
+                        loaded[name] = 0
+                        continue
+                    version = None
+                    if version_name:
+                        version = versions.get(version_name, 0) if versions is not None else None
+                        if version is None or version not in meta['versions']:
+                            loaded[name] = 'stale'
+                            continue
+                    start = base + meta['offset']
+                    entries = pickle.loads(view[start:start + meta['length']])
+                    # Versiyasi mos yozuvlar dolzarb - TTL yangilanadi; versiyasiz bo'limda qolgan TTL ishlatiladi
+                    loaded[name] = cache.load(entries, age=age, version=version)
+
+        logger.info(f"Cache snapshot yuklandi ({age:.0f}s oldingi): {loaded}")
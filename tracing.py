@@ -0,0 +1,172 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import functools
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+
+from telegram.ext import Application
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger("slow_updates")
+
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+
+
+class Trace:
+    """Bitta update uchun span'lar (nom, davomiylik ms) ro'yxati"""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def add(self, name, duration_ms):
+        # to_thread ichidan ham chaqiriladi - list.append thread-safe
+        self.spans.append((name, duration_ms))
+
+    def format(self, total_ms):
+        lines = [f"{self.name}: {total_ms:.1f}ms"]
+        for name, duration_ms in self.spans:
+            lines.append(f"  {name:<40} {duration_ms:8.1f}ms")
+        return "\n".join(lines)
+
+
+@contextmanager
+def span(name):
+    """Joriy update trace'iga span qo'shish (trace bo'lmasa hech narsa qilmaydi)"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, (time.perf_counter() - started) * 1000)
+
+
+def traced(name):
+    """Funksiya (sync yoki async) chaqiruvini span sifatida o'lchaydigan dekorator"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_methods(prefix, exclude=()):
+    """Klassning barcha ochiq metodlarini '<prefix>.<metod>' span'lari bilan o'rash"""
+    def decorator(cls):
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith('_') or attr in exclude or not callable(value):
+                continue
+            setattr(cls, attr, traced(f"{prefix}.{attr}")(value))
+        return cls
+    return decorator
+
+
+def _update_name(update):
+    user = update.effective_user
+    if update.callback_query:
+        kind = f"callback:{update.callback_query.data}"
+    elif update.message and update.message.text:
+        kind = "command" if update.message.text.startswith('/') else "text"
+    elif update.message:
+        kind = "media"
+    else:
+        kind = "other"
+    return f"update {update.update_id} ({kind}, user {user.id if user else '-'})"
+
+
+class TracingApplication(Application):
+    """Har bir update uchun trace ochadi va sekin update'larni slow log'ga yozadi"""
+
+    async def process_update(self, update):
+        # Shu vaqtdan (ms) uzoq davom etgan update'lar slow log'ga yoziladi. 0 - tracing o'chiq.
+        # Import paytida emas, har chaqiruvda o'qiladi - load_dotenv() dan keyin ham ishlaydi
+        slow_update_ms = float(os.getenv('SLOW_UPDATE_MS', '1000'))
+        if not slow_update_ms:
+            return await super().process_update(update)
+
+        trace = Trace(_update_name(update))
+        token = _current_trace.set(trace)
+        try:
+            return await super().process_update(update)
+        finally:
+            _current_trace.reset(token)
+            total_ms = (time.perf_counter() - trace.started) * 1000
+            if total_ms >= slow_update_ms:
+                slow_logger.warning("Slow update\n%s", trace.format(total_ms))
+
+
+class TracingRequest(HTTPXRequest):
+    """Bot API chaqiruvlarini 'api.<method>' span'lari bilan o'lchaydi"""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        with span(f"api.{url.rsplit('/', 1)[-1]}"):
+            return await super().do_request(url, method, *args, **kwargs)
+
+
+class StackSampler:
+    """
+    So'ralganda N soniya davomida barcha thread'larning stack'ini sample qiladi
+    (event loop + to_thread ishchilari). Natija - flame graph uchun "collapsed" format
+    (flamegraph.pl, speedscope). Ishlamayotganda hech qanday overhead yo'q.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._lock.locked()
+
+    async def profile(self, seconds):
+        """Qaytaradi: (collapsed stack matni, sample'lar soni)"""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("Profiling allaqachon ishlayapti")
+        try:
+            counts = Counter()
+            stop = threading.Event()
+            thread = threading.Thread(target=self._sample, args=(counts, stop), name="stack-sampler", daemon=True)
+            thread.start()
+            await asyncio.sleep(seconds)
+            stop.set()
+            await asyncio.to_thread(thread.join)
+        finally:
+            self._lock.release()
+
+        collapsed = "\n".join(f"{stack} {count}" for stack, count in counts.most_common())
+        return collapsed, sum(counts.values())
+
+    def _sample(self, counts, stop):
+        me = threading.get_ident()
+        while not stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                counts[";".join(reversed(stack))] += 1
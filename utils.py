@@ -1,30 +1,96 @@
+import os
 import re
+import asyncio
+import logging
 from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden
 
-async def check_user_subscription(bot, user_id, required_channels):
+from cache import TTLCache
+from tracing import traced
+from breaker import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+# Faqat ijobiy natijalar keshlanadi: (user_id, channel_id) -> True.
+# A'zo bo'lmaganlar har safar qayta tekshiriladi (obuna bo'lgach darhol o'tishi uchun)
+subscription_cache = TTLCache(ttl=120, max_size=100000)
+
+# Oxirgi ma'lum holat (True/False) - faqat Telegram ishlamay qolganda (last_known siyosati) ishlatiladi
+last_known_status = TTLCache(ttl=24 * 3600, max_size=200000)
+
+# Har bir kanal uchun alohida breaker
+subscription_breakers = {}
+
+def _breaker(channel_id):
+    breaker = subscription_breakers.get(channel_id)
+    if breaker is None:
+        breaker = subscription_breakers[channel_id] = CircuitBreaker(f"subs:{channel_id}")
+    return breaker
+
+def _degraded(user_id, channel_id):
     """
-    Foydalanuvchi majburiy kanallarga a'zo ekanligini tekshiradi (Async).
-    Qaytaradi: A'zo bo'lmagan kanallar ro'yxati.
+    Kanal tekshiruvi ishlamayotganda SUBSCRIPTION_FAIL_POLICY bo'yicha javob:
+    open - o'tkazish, closed - a'zo emas deb hisoblash,
+    last_known - oxirgi ma'lum holat (u ham bo'lmasa - o'tkazish).
     """
-    not_subscribed = []
+    # .env bot.py da importlardan keyin yuklanadi - shuning uchun har safar o'qiymiz
+    policy = os.getenv('SUBSCRIPTION_FAIL_POLICY', 'last_known')
+    if policy == 'closed':
+        return False
+    if policy == 'last_known':
+        return last_known_status.get((user_id, channel_id), True)
+    return True
 
-    for channel in required_channels:
-        channel_id = channel['channel_id']
-        try:
-            # Telegram API orqali tekshirish (Await shart!)
-            member = await bot.get_chat_member(chat_id=channel_id, user_id=user_id)
+async def _is_subscribed(bot, user_id, channel):
+    channel_id = channel['channel_id']
+    if subscription_cache.get((user_id, channel_id)):
+        return True
 
-            # Agar foydalanuvchi chiqib ketgan, haydalgan yoki a'zo bo'lmasa
-            if member.status in ['left', 'kicked', 'banned']:
-                not_subscribed.append(channel)
-        except Exception as e:
-            # Agar bot kanalga admin bo'lmasa yoki xatolik bo'lsa
-            # Xavfsizlik uchun a'zo emas deb hisoblaymiz
-            print(f"Error checking subscription for {channel_id}: {e}")
-            not_subscribed.append(channel)
+    breaker = _breaker(channel_id)
+    token = breaker.allow()
+    if token is None:
+        # Breaker ochiq - sekin so'rov qilinmaydi
+        return _degraded(user_id, channel_id)
 
-    return not_subscribed
+    try:
+        # Telegram API orqali tekshirish (Await shart!)
+        member = await asyncio.wait_for(
+            bot.get_chat_member(chat_id=channel_id, user_id=user_id),
+            timeout=float(os.getenv('SUBSCRIPTION_CHECK_TIMEOUT', '3'))
+        )
+    except (BadRequest, Forbidden) as e:
+        # Telegram javob berdi (bot kanalga admin emas, foydalanuvchi topilmadi va h.k.) -
+        # bu uzilish emas, xavfsizlik uchun a'zo emas deb hisoblaymiz
+        breaker.record_success(token)
+        logger.warning(f"Error checking subscription for {channel_id}: {e}")
+        return False
+    except Exception as e:
+        # Timeout, tarmoq xatosi, flood limit - breaker'ga xato sifatida yoziladi
+        breaker.record_failure(token)
+        logger.warning(f"Subscription check failed for {channel_id}: {e!r}")
+        return _degraded(user_id, channel_id)
+
+    breaker.record_success(token)
+    # Agar foydalanuvchi chiqib ketgan, haydalgan yoki a'zo bo'lmasa
+    subscribed = member.status not in ['left', 'kicked', 'banned']
+    if subscribed:
+        subscription_cache.set((user_id, channel_id), True)
+    last_known_status.set((user_id, channel_id), subscribed)
+    return subscribed
+
+@traced("subs.check_user_subscription")
+async def check_user_subscription(bot, user_id, required_channels):
+    """
+    Foydalanuvchi majburiy kanallarga a'zo ekanligini tekshiradi (Async).
+    Barcha kanallar parallel tekshiriladi (ketma-ket emas).
+    Qaytaradi: A'zo bo'lmagan kanallar ro'yxati.
+    """
+    results = await asyncio.gather(
+        *(_is_subscribed(bot, user_id, channel) for channel in required_channels)
+    )
+    return [channel for channel, ok in zip(required_channels, results) if not ok]
 
+@traced("format.channels_list")
 def format_channels_list(channels):
     """
     A'zo bo'lish kerak bo'lgan kanallar ro'yxatini chiroyli matn qilib qaytaradi.
@@ -47,6 +113,7 @@ def format_channels_list(channels):
     text += "\n✅ <i>Obuna bo'lgach, «Tekshirish» tugmasini bosing.</i>"
     return text
 
+@traced("format.clean_caption")
 def clean_caption(caption, bot_username):
     """
     Captiondagi barcha havolalarni va begona usernamelarni